@@ -14,6 +14,7 @@
 
 import string
 import re
+import os
 
 kUnknown    = 0
 kBracket    = 1
@@ -112,6 +113,35 @@ def StringToInt(value): #std::wcstol behaviour
     if value != "":
         return int(value)
     return 0
+def EpisodeRange(elements):
+    '''Returns the first and last episode numbers of the parsed elements as integers, or zeros if there are none'''
+    episodes = elements.get(kElementEpisodeNumber)
+    if episodes is None:
+        return 0, 0
+
+    # Episodes are kept as strings. A single episode is a string, otherwise a list of two strings
+    if isinstance(episodes, list):
+        try:
+            start = int(episodes[0])
+        except ValueError:
+            start = 0
+
+        try:
+            end = int(episodes[1])
+        except ValueError:
+            end = start
+    else:
+        try:
+            start = int(episodes)
+            end = start
+        except ValueError:
+            start = 0
+            end = 0
+    return start, end
+def Summarize(elements):
+    '''Reduces the parsed elements to a compact (title, start, end, season, type) tuple'''
+    start, end = EpisodeRange(elements)
+    return elements.get(kElementAnimeTitle, ""), start, end, elements.get(kElementAnimeSeason, ""), elements.get(kElementAnimeType, "")
 def DebugTokens(toklist):
     out = ""
     footer = ""
@@ -153,15 +183,22 @@ class Keyword:
 
 
 class Keywords:
-    list = []
+    list = None       # type: list
+    words = None      # type: dict
+    categories = None # type: dict
     peekentries = {
         kElementAudioTerm: ["Dual Audio"],
         kElementVideoTerm: ["H264","H.264","h264","h.264"],
         kElementVideoResolution: ["480p","720p","1080p"],
         kElementSource: ["Blu-Ray"]
     }
+    _re_peek = re.compile("|".join([re.escape(keyword) for category in peekentries for keyword in peekentries[category]]))
 
     def __init__(self):
+        self.list = []
+        self.words = {}      # word -> Keyword
+        self.categories = {} # category -> {word -> Keyword}
+
         self.Add(kElementAnimeSeasonPrefix, False, True, True, ["SAISON","SEASON"])
 
         self.Add(kElementAnimeType, False, True, True, ["GEKIJOUBAN","MOVIE","OAD","OAV","ONA","OVA","SPECIA","SPECIALS","TV"])
@@ -197,10 +234,9 @@ class Keywords:
 
     def Exists(self, keyword, category = None):
         keyword = keyword.upper() #normalize
-        for item in self.list:
-            if item.word == keyword and (not category or item.category == category):
-                return True
-        return False
+        if not category:
+            return keyword in self.words
+        return keyword in self.categories.get(category, ())
 
     def Add(self, category, identifiable, searchable, valid, keywords):
         for word in keywords:
@@ -210,18 +246,19 @@ class Keywords:
                 continue
             item = Keyword(word, category, identifiable, searchable, valid)
             self.list.append(item)
+            self.words[word] = item
+            self.categories.setdefault(category, {})[word] = item
 
     def Find(self, category, keyword):
-        keyword = keyword.upper() #normalize
-        for item in self.list:
-            if item.word == keyword:
-                if category == kElementUnknown or item.category == category:
-                    return item
-                return None
+        item = self.words.get(keyword.upper()) #normalize
+        if item and (category == kElementUnknown or item.category == category):
+            return item
         return None
 
     def Peek(self, filename, offset, size, elements):
         peeklist = []
+        if not self._re_peek.search(filename, offset, offset + size):
+            return peeklist
 
         for category in self.peekentries:
             for keyword in self.peekentries[category]:
@@ -239,6 +276,7 @@ class Token:
     category = None # type: int
     content = None  # type: str
     enclosed = None # type: bool
+    index = -1      # type: int  # position inside the owning Tokens list
 
     def __init__(self, category = kUnknown, content = None, enclosed = False):
         self.category = category
@@ -277,22 +315,37 @@ class Token:
 
 
 class Tokens(list):
+    '''Token list where every token knows its own position, so that neighbour searches never scan or copy the list'''
+    def append(self, tok):
+        tok.index = len(self)
+        list.append(self, tok)
+
+    def insert(self, index, tok):
+        list.insert(self, index, tok)
+        self.Reindex(index)
+
+    def Reindex(self, start=0):
+        for index in xrange(start, len(self)):
+            self[index].index = index
+
+    def RemoveInvalid(self):
+        self[:] = [x for x in self if x.category != kInvalid]
+        self.Reindex()
+
+    def Range(self, start=None, end=None):
+        '''Positions covered by self[start:end], without copying the slice'''
+        return xrange(*slice(start, end).indices(len(self)))
+
     def FindNext(self, tok, flags):
-        index = self.index(tok)
-        if index == -1:
-            return None
-        for tok in self[index+1:]:
-            if tok.CheckFlags(flags):
-                return tok
+        for index in xrange(tok.index + 1, len(self)):
+            if self[index].CheckFlags(flags):
+                return self[index]
         return None
 
     def FindPrev(self, tok, flags):
-        index = self.index(tok)
-        if index == -1:
-            return None
-        for tok in reversed(self[0:index]):
-            if tok.CheckFlags(flags):
-                return tok
+        for index in xrange(tok.index - 1, -1, -1):
+            if self[index].CheckFlags(flags):
+                return self[index]
         return None
 
     def IsIsolated(self, tok):
@@ -306,28 +359,31 @@ class Tokens(list):
         return True
 
     def FindFirst(self, flags, start=None, end=None):
-        for tok in self[start:end]:
-            if tok.CheckFlags(flags):
-                return tok
+        for index in self.Range(start, end):
+            if self[index].CheckFlags(flags):
+                return self[index]
         return None
 
     def FindLast(self, flags, start=None, end=None):
-        for tok in reversed(self[start:end]):
-            if tok.CheckFlags(flags):
-                return tok
+        for index in reversed(self.Range(start, end)):
+            if self[index].CheckFlags(flags):
+                return self[index]
         return None
 
     def FindFirstIndex(self, flags, start=0, end=None):
-        for index, tok in enumerate(self[start:end]):
-            if tok.CheckFlags(flags):
-                return start + index
+        # results are relative to the given start, to match slicing with a negative start
+        positions = self.Range(start, end)
+        for index in positions:
+            if self[index].CheckFlags(flags):
+                return start + index - positions[0]
         return -1
 
     def FindLastIndex(self, flags, start=0, end=None):
         e = end or len(self)
-        for index, tok in enumerate(reversed(self[start:end])):
-            if tok.CheckFlags(flags):
-                return e - index
+        positions = self.Range(start, end)
+        for index in reversed(positions):
+            if self[index].CheckFlags(flags):
+                return e - (positions[-1] - index)
         return -1
 
     def distance(self, start, end):
@@ -339,7 +395,7 @@ class Tokens(list):
 
 
 class Tokenizer:
-    tokens = Tokens()
+    tokens = None # type: Tokens
 
     _elements = None # type: Elements
     _filename = None # type: str
@@ -353,10 +409,14 @@ class Tokenizer:
         [u"\uFF08", u"\uFF09"], # Fullwidth parenthesis
     ]
     _delimiters = " _.&+,|"
+    _closing = dict((p[0], p[1]) for p in _brackets)
+    _re_opening = re.compile(u"[" + re.escape(u"".join(p[0] for p in _brackets)) + u"]")
+    _re_delimiters = re.compile("([" + re.escape(_delimiters) + "])")
 
     def __init__(self, filename, elements):
         self._filename = filename
         self._elements = elements
+        self.tokens = Tokens()
 
     def Tokenize(self):
         del self.tokens[:] #clear list
@@ -369,19 +429,16 @@ class Tokenizer:
         char_begin = 0
         char_end = len(self._filename)
 
-        def find_first_bracket(text, start):
-            for c in range(start, len(text)):
-                for p in self._brackets:
-                    if (text[c] == p[0]):
-                        return [c, p[1]]
-            return [len(text), None]
-
         current_char = 0
         while current_char < char_end and char_begin < char_end:
             if not is_open:
-                result = find_first_bracket(self._filename, char_begin)
-                current_char = result[0]
-                matching_bracket = result[1]
+                m = self._re_opening.search(self._filename, char_begin)
+                if m:
+                    current_char = m.start()
+                    matching_bracket = self._closing[m.group()]
+                else:
+                    current_char = char_end
+                    matching_bracket = None
             else:
                 current_char = self._filename.find(matching_bracket, char_begin, char_end)
                 if (current_char == -1):
@@ -410,60 +467,37 @@ class Tokenizer:
     def TokenizeByPreidentified(self, enclosed, offset, size):
         pretokens = kwmanager.Peek(self._filename, offset, size, self._elements)
 
-        tokoffset = offset
-        suboffset = offset
-        subsize = 0
-
-        while tokoffset < offset + size:
-            for pt in pretokens:
-                if tokoffset == pt[0]:
-                    if subsize > 0:
-                        self.TokenizeByDelimiters(enclosed, suboffset, subsize)
-                    t = Token(kIdentifier, self._filename[pt[0]:pt[0] + pt[1]], enclosed)
-                    self.tokens.append(t)
+        # the first keyword found at a position wins, and keywords overlapping an earlier one are skipped
+        starts = {}
+        for pt in pretokens:
+            starts.setdefault(pt[0], pt[1])
 
-                    suboffset = pt[0]+pt[1]
-                    tokoffset = suboffset - 1
-
-                    break
-
-            tokoffset = tokoffset + 1
-            subsize = tokoffset - suboffset
+        suboffset = offset
+        for start in sorted(starts):
+            if start < suboffset:
+                continue
+            if start > suboffset:
+                self.TokenizeByDelimiters(enclosed, suboffset, start - suboffset)
+            t = Token(kIdentifier, self._filename[start:start + starts[start]], enclosed)
+            self.tokens.append(t)
+            suboffset = start + starts[start]
 
-        if subsize > 0:
-            self.TokenizeByDelimiters(enclosed, suboffset, subsize)
+        if suboffset < offset + size:
+            self.TokenizeByDelimiters(enclosed, suboffset, offset + size - suboffset)
 
     def TokenizeByDelimiters(self, enclosed, offset, size):
-        delimiters = self.GetDelimiters(offset, size)
-        if not delimiters:
-            t = Token(kUnknown, self._filename[offset:offset + size], enclosed)
+        parts = self._re_delimiters.split(self._filename[offset:offset + size])
+        if len(parts) == 1:
+            t = Token(kUnknown, parts[0], enclosed)
             self.tokens.append(t)
             return
 
-        char_begin = offset
-        char_end = offset + size
-        current_char = offset
-
-        while current_char < char_end:
-            current_char = FindAny(self._filename, delimiters, current_char, char_end)
-            if (current_char == -1):
-                current_char = char_end
-
-            suboffset = char_begin
-            subsize = current_char - char_begin
-
-            if subsize > 0:
-                content = self._filename[suboffset:suboffset+subsize]
-                t = Token(kUnknown, content, enclosed)
-                self.tokens.append(t)
-
-            if current_char < char_end:
-                content = self._filename[suboffset+subsize:suboffset+subsize+1]
-                t = Token(kDelimiter, content, enclosed)
-                self.tokens.append(t)
-
-                current_char = current_char + 1
-                char_begin = current_char
+        # split() alternates between the text around delimiters and the captured delimiters
+        for index, content in enumerate(parts):
+            if index & 1:
+                self.tokens.append(Token(kDelimiter, content, enclosed))
+            elif content:
+                self.tokens.append(Token(kUnknown, content, enclosed))
         self.ValidateDelimiterTokens()
 
     def ValidateDelimiterTokens(self):
@@ -518,22 +552,13 @@ class Tokenizer:
                             next_token.AppendTo(prev_token)
 
         # remove tokens marked as invalid
-        self.tokens[:] = [x for x in self.tokens if x.category != kInvalid]
-
-    def GetDelimiters(self, offset, size):
-        delimiters = ""
-        for c in range(offset, offset + size):
-            char = self._filename[c]
-            if not char.isalnum():
-                if char in self._delimiters:
-                    if not char in delimiters:
-                        delimiters = delimiters + char
-        return delimiters
+        self.tokens.RemoveInvalid()
 
 class Parser:
     parse_group = True
     parse_title = True
     parse_episode = True
+    parse_extras = True
 
     _elements = None # type: Elements
     _tokens = None   # type: Tokens
@@ -564,6 +589,10 @@ class Parser:
         if self.parse_episode:
             self.SearchForEpisodeNumber()
         self.SearchForAnimeTitle()
+
+        # The remaining stages only fill in elements that cannot change the anime title or episode number
+        if not self.parse_extras:
+            return kElementAnimeTitle in self._elements
         if self.parse_group and kElementReleaseGroup not in self._elements:
             self.SearchForReleaseGroup()
         if self.parse_title and kElementEpisodeNumber in self._elements:
@@ -746,12 +775,10 @@ class Parser:
 
                 number = word[number_begin:]
                 if self.MatchEpisodePatterns(number, tok) or self.SetEpisodeNumber(number, tok, True):
-                    idx = self._tokens.index(tok)
-                    if idx != -1:
-                        # Split token
-                        tok.content = number
-                        newtok = Token(kIdentifier if keyword.identifiable else kUnknown, prefix, tok.enclosed)
-                        self._tokens.insert(idx, newtok)
+                    # Split token
+                    tok.content = number
+                    newtok = Token(kIdentifier if keyword.identifiable else kUnknown, prefix, tok.enclosed)
+                    self._tokens.insert(tok.index, newtok)
 
                     return True
 
@@ -858,7 +885,7 @@ class Parser:
                     continue
 
     def SearchForEpisodeNumber(self):
-        subtokens = Tokens()
+        subtokens = [] # plain list, as a Tokens list would take over the token positions
         for tok in self._tokens:
             if tok.category == kUnknown:
                 if FindAny(tok.content, string.digits) != -1:
@@ -993,7 +1020,7 @@ class Parser:
         for tok in toklist:
             # Assuming that episode number always comes after the title, first token
             # cannot be what we're looking for
-            index = self._tokens.index(tok)
+            index = tok.index
             if index == 0:
                 continue
 
@@ -1002,7 +1029,7 @@ class Parser:
                 continue
 
             # Ignore if it's the first non-enclosed, non-delimiter token
-            if all(t.enclosed or t.category == kDelimiter for t in self._tokens[:index]):
+            if all(self._tokens[i].enclosed or self._tokens[i].category == kDelimiter for i in xrange(index)):
                 continue
 
             # Ignore if the previous token is "Movie" or "Part"
@@ -1044,9 +1071,9 @@ class Parser:
             last_bracket = end
             bracket_open = False
 
-            for loc, tok in enumerate(self._tokens[start:end]):
-                if tok.category == kBracket:
-                    last_bracket = start + loc
+            for loc in self._tokens.Range(start, end):
+                if self._tokens[loc].category == kBracket:
+                    last_bracket = loc
                     bracket_open = not bracket_open
             if bracket_open:
                 end = last_bracket
@@ -1060,7 +1087,7 @@ class Parser:
             while curtok and curtok.category == kBracket and curtok.content != ")":
                 curtok = self._tokens.FindPrev(curtok, kFlagBracket)
                 if curtok:
-                    end = self._tokens.index(curtok)
+                    end = curtok.index
                     curtok = self._tokens.FindPrev(curtok, kFlagNotDelimiter)
 
         self.BuildElement(kElementAnimeTitle, False, start, end)
@@ -1101,7 +1128,8 @@ class Parser:
         if end == -1:
             end = None
         value = ""
-        for tok in self._tokens[start:end]:
+        for index in self._tokens.Range(start, end):
+            tok = self._tokens[index]
             if tok.category == kUnknown:
                 value += tok.content
                 tok.category = kIdentifier
@@ -1137,6 +1165,65 @@ class Parser:
                 pass #discard
 
 
+class FastParser:
+    '''Regex shortcut for "[Group] Title - 01 [tags]" names, accepting only those the full parser reads the same way'''
+    _wordchars = "".join(c for c in string.printable if c not in string.whitespace + Tokenizer._delimiters + "()[]{}")
+    _word = "[" + re.escape(_wordchars) + "]+"
+    _words = _word + "(?: " + _word + ")*"
+    _re_shape = re.compile("^\\[(" + _words + ")\\] (" + _words + ") - (\\d{1,3})((?: ?(?:\\[" + _words + "\\]|\\(" + _words + "\\)))*)\\Z")
+    _re_tagwords = re.compile(_word)
+    _re_resolution = re.compile("\\d{3,4}[pP]$|\\d{3,4}[xX]\\d{3,4}$")
+    _peekwords = [keyword for category in Keywords.peekentries for keyword in Keywords.peekentries[category]]
+
+    # Keywords with digits that always become identifiers, no matter how often they appear
+    _safewords = set(item.word for item in kwmanager.list if item.identifiable and item.searchable and item.category in Parser._searchable and item.category in Parser._multiple)
+    # Keywords that set the season or anime type, which the full parser would report, and episode prefixes, which make
+    # the full parser take the next number as the episode
+    _typewords = set(kwmanager.categories.get(kElementAnimeType, ())) | set(kwmanager.categories.get(kElementAnimeSeasonPrefix, ())) | \
+        set(kwmanager.categories.get(kElementEpisodePrefix, ()))
+
+    @staticmethod
+    def IsCrcLike(word):
+        return len(word) == 8 and IsHexadecimalString(word)
+
+    def Parse(self, filename, elements):
+        # Returns True once the elements are filled in, or False to leave the name to the full parser
+        m = self._re_shape.match(filename)
+        if not m:
+            return False
+        title = m.group(2)
+
+        # Title words must all stay unknown tokens, otherwise the title could end early
+        if any(keyword in title for keyword in self._peekwords):
+            return False
+        for word in title.split(" "):
+            if word.strip("-") == "" or any(c.isdigit() for c in word) or self.IsCrcLike(word):
+                return False
+            if kwmanager.Exists(TrimString(word, " -")):
+                return False
+
+        # Group and tag words may not offer the episode search another candidate
+        crcs = 0
+        for word in self._re_tagwords.findall(m.group(1) + " " + m.group(4)):
+            word = TrimString(word, " -")
+            upper = word.upper()
+            if upper in self._typewords:
+                return False
+            if self.IsCrcLike(word):
+                crcs += 1
+                if crcs > 1:
+                    return False
+                continue
+            if any(c.isdigit() for c in word) and upper not in self._safewords and not self._re_resolution.match(word):
+                return False
+
+        elements[kElementAnimeTitle] = title
+        elements[kElementEpisodeNumber] = m.group(3)
+        return True
+
+_fastparser = FastParser()
+
+
 class Elements(dict):
     def __setitem__(self, key, value):
         if key in self:
@@ -1147,40 +1234,88 @@ class Elements(dict):
         dict.__setitem__(self, key, value)
 
 class Anitomy:
-    elements = Elements()
+    elements = None # type: Elements
 
     parse_ext = True
     parse_group = True
     parse_title = True
     parse_episode = True
+    parse_extras = True # release group, episode title and element validation
+    parse_fast = False  # try the FastParser shortcut before tokenizing
+
+    def __init__(self):
+        self.elements = Elements()
 
     def parse(self, filename):
-        self.elements.clear()
+        '''Parses the filename into the elements of this instance. Use parse_elements when sharing an instance between threads'''
+        elements = Elements()
+        result = self.ParseInto(filename, elements)
+        self.elements = elements
+        return result
+
+    def parse_elements(self, filename):
+        '''Parses the filename and returns its own set of elements, or None if it could not be parsed'''
+        elements = Elements()
+        if self.ParseInto(filename, elements):
+            return elements
+        return None
+
+    def ParseInto(self, filename, elements):
+        # all parse state lives in the given elements and the tokenizer/parser objects made here, so calls can run concurrently
         if (self.parse_ext):
             result = self.RemoveExtensionFromFilename(filename)
             if (result):
                 filename = result["name"]
-                self.elements[kElementFileExtension] = result["ext"]
+                elements[kElementFileExtension] = result["ext"]
 
         if not filename:
             return False
-        self.elements[kElementFileName] = filename
+        elements[kElementFileName] = filename
+
+        # the shortcut only knows about titles and episodes, so it cannot stand in for the extra stages
+        if self.parse_fast and self.parse_episode and not self.parse_extras:
+            if _fastparser.Parse(filename, elements):
+                return True
 
         # split the string into tokens
-        t = Tokenizer(filename, self.elements)
+        t = Tokenizer(filename, elements)
         if not t.Tokenize():
             return False
 
         # bin the tokens into their appropriate buckets
-        p = Parser(self.elements, t.tokens)
+        p = Parser(elements, t.tokens)
         p.parse_episode = self.parse_episode
         p.parse_group = self.parse_group
         p.parse_title = self.parse_title
+        p.parse_extras = self.parse_extras
         if not p.Parse():
             return False
 
         return True
 
+    def parse_summary(self, filename):
+        '''Parses the filename and returns its Summarize tuple, or None if it could not be parsed'''
+        elements = self.parse_elements(filename)
+        if elements is None:
+            return None
+        return Summarize(elements)
+
+    def parse_many(self, filenames, processes=0, chunksize=256, pool=None):
+        '''Returns parse_summary for every filename, spreading large batches across a process pool'''
+        if pool is None and processes > 1:
+            pool = ParsePool(self, processes)
+            try:
+                return self.parse_many(filenames, processes, chunksize, pool)
+            finally:
+                pool.close()
+        # Falls back to parsing in this process if a pool cannot be used on this platform
+        if pool is not None and len(filenames) > chunksize:
+            results = pool.map(filenames, chunksize)
+            if results is not None:
+                return results
+        return [self.parse_summary(filename) for filename in filenames]
+
+
     def RemoveExtensionFromFilename(self, filename):
         pos = filename.rfind('.')
         if (pos == -1):
@@ -1192,4 +1327,50 @@ class Anitomy:
             return False
         if not kwmanager.Exists(ext, kElementFileExtension):  #must be a recognized file extention
             return False
-        return {"name": filename[:pos], "ext": ext}
\ No newline at end of file
+        return {"name": filename[:pos], "ext": ext}
+
+
+class ParsePool(object):
+    '''Worker processes for Anitomy.parse_many, started on first use and shared by every batch until closed'''
+    def __init__(self, anitomy, processes):
+        self._anitomy = anitomy
+        self._processes = processes
+        self._pool = None
+        self._failed = not hasattr(os, "fork")
+
+    def map(self, filenames, chunksize):
+        '''Returns parse_summary for every filename, or None if a pool cannot be used on this platform'''
+        if self._failed:
+            return None
+        try:
+            if self._pool is None:
+                import multiprocessing
+                a = self._anitomy
+                self._pool = multiprocessing.Pool(self._processes, _InitWorker, (a.parse_ext, a.parse_group, a.parse_title, a.parse_episode, a.parse_extras, a.parse_fast))
+            return self._pool.map(_ParseWorker, filenames, chunksize)
+        except (ImportError, OSError, EnvironmentError):
+            self._failed = True
+            self.close()
+            return None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+_worker = None # type: Anitomy
+
+def _InitWorker(parse_ext, parse_group, parse_title, parse_episode, parse_extras, parse_fast):
+    global _worker
+    _worker = Anitomy()
+    _worker.parse_ext = parse_ext
+    _worker.parse_group = parse_group
+    _worker.parse_title = parse_title
+    _worker.parse_episode = parse_episode
+    _worker.parse_extras = parse_extras
+    _worker.parse_fast = parse_fast
+
+def _ParseWorker(filename):
+    return _worker.parse_summary(filename)
@@ -3,16 +3,30 @@
 # This source code is released under the MIT license
 # https://opensource.org/licenses/MIT
 
-import os, urllib2
-from datetime import datetime, time
+import os, time, urllib2, fnmatch, hashlib
+from datetime import datetime
 import json
 
 from anitomy import *
 from unicodedata import normalize
 from .relations import Relationships
-from collections import deque
+from collections import deque, OrderedDict
 from HTMLParser import HTMLParser
 from service.base import AnimeService
+from util import LRUCache, WorkerPool, atomic_write
+from threading import Thread, Lock
+from Queue import Queue, Empty
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    # Reports the entry types along with the names, which saves a stat per entry on network shares
+    from scandir import scandir
+except ImportError:
+    scandir = None
 
 
 # =====================================================================================================================
@@ -50,52 +64,97 @@ _ord = [["1st", "first"], ["2nd", "second"], ["3rd", "third"], ["4th", "fourth"]
 _seasons = [["1", "1st season", "season 1", "series 1", "s1"],["2", "2nd season", "season 2", "series 2", "s2"],["3", "3rd season", "season 3", "series 3", "s3"],["4", "4th season", "season 4", "series 4", "s4"],["5", "5th season", "season 5", "series 5", "s5"],["6", "6th season", "season 6", "series 6", "s6"]]
 _extra = [["and", "&"],["", "the animation", "the", "episode", "(tv)"],["ova", "oad", "oav"],["sp", "specials", "special"]]
 
-def whole_replace(value, old, new):
-    if old == "" or old == new or len(value) < len(old):
+class WholeWordReplacer(object):
+    """Replaces whole words in a single regex pass, given a list of [new, old, old, ...] rows"""
+    _boundary = "[" + re.escape(_wordboundary) + "]"
+
+    def __init__(self, reps):
+        self._map = {}
+        for rep in reps:
+            for old in rep[1:]:
+                if old and old != rep[0] and old not in self._map:
+                    self._map[old] = rep[0]
+
+        # Longest words first, so that a shorter word cannot shadow a longer one at the same position
+        words = sorted(self._map, key=len, reverse=True)
+        self._re = re.compile("(?:" + "|".join(re.escape(w) for w in words) + ")(?=" + self._boundary + "|\\Z)")
+
+    def __call__(self, value):
+        if not self._re.search(value):
+            return value
+
+        # The leading word boundary is checked here rather than in the pattern, because a replacement changes the
+        #   character that precedes an adjacent match, which is what the sequential replace used to compare against
+        state = [-1, True]  # end of the previous replacement, and whether the text it left behind ends on a boundary
+
+        def replace(m):
+            pos = m.start()
+            if pos == state[0]:
+                bounded = state[1]
+            else:
+                bounded = pos == 0 or value[pos - 1] in _wordboundary
+            if not bounded:
+                return m.group(0)
+
+            new = self._map[m.group(0)]
+            state[0] = m.end()
+            state[1] = new[-1] in _wordboundary if new else True  # a removal leaves the previous boundary in place
+            return new
+
+        return self._re.sub(replace, value)
+
+class WholeWordSequence(object):
+    """Replaces whole words one at a time, in table order, for tables where one replacement can affect the next"""
+    def __init__(self, reps):
+        self._passes = []
+        words = set()
+        for rep in reps:
+            for old in rep[1:]:
+                if old:
+                    self._passes.append((old, WholeWordReplacer([[rep[0], old]])))
+                    words.add(old)
+        self._re = re.compile("|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
+
+    def __call__(self, value):
+        # A single search for any of the words first, so most titles skip every pass
+        if self._re.search(value):
+            for old, rep in self._passes:
+                if old in value:
+                    value = rep(value)
         return value
 
-    pos = value.find(old)
-    while pos != -1:
-        end = pos + len(old)
-        if not ((pos == 0 or value[pos - 1] in _wordboundary) and (end >= len(value) or value[end] in _wordboundary)):
-            pos += len(old)
-        else:
-            value = value[:pos] + new + value[pos+len(old):]
-            pos += len(new)
-        pos = value.find(old, pos)
-    return value
-
-def replace_pairs(value, reps, whole):
-    for rep in reps:
-        new = rep[0]
-        for idx in range(1, len(rep)):
-            old = rep[idx]
-            if whole:
-                value = whole_replace(value, old, new)
-            else:
-                value = value.replace(old, new)
-    return value
+_norm_roman = WholeWordReplacer(_roman)
+_norm_transa = dict((ord(rep[idx]), unicode(rep[0])) for rep in _transa for idx in range(1, len(rep)))
+_norm_transb = WholeWordReplacer(_transb)
+_norm_ord = WholeWordReplacer(_ord)
+_norm_seasons = WholeWordSequence(_seasons)
+_norm_extra = WholeWordSequence(_extra[:2])
+_norm_extra_types = WholeWordReplacer(_extra[2:])
+_norm_strip = "".join(chr(c) for c in range(256) if not chr(c).isalnum())
+
+# Release groups name every episode of a season the same way, so the same titles get normalized over and over
+title_cache = LRUCache(8192)
 
 def normalize_title(value):
-    value = replace_pairs(value, _roman, True)
-    value = replace_pairs(value, _transa, False)
-    value = replace_pairs(value, _transb, True)
+    norm = title_cache.get(value)
+    if norm is None:
+        norm = _normalize_title(value)
+        title_cache.set(value, norm)
+    return norm
+
+def _normalize_title(value):
+    value = _norm_roman(value)
+    value = unicode(value).translate(_norm_transa)
+    value = _norm_transb(value)
     value = normalize('NFKD', value).encode('ascii', 'ignore') #deconstruct unicode and then remove the non-ascii extras
     value = value.lower()
-    value = replace_pairs(value, _ord, True)
-    value = replace_pairs(value, _seasons, True)
-    value = replace_pairs(value, _extra, True)
-    value = value.strip()
-
-    # Remove all spaces and unicode punctuation
-    out = ""
-    for c in value:
-        o = ord(c)
-        if (o < 0xFF and not c.isalnum()) or (o > 0x2000 and o < 0x2767):
-            pass
-        else:
-            out += c
-    return out
+    value = _norm_ord(value)
+    value = _norm_seasons(value)
+    value = _norm_extra(value)
+    value = _norm_extra_types(value)
+
+    # Remove all spaces and punctuation. Only ascii is left at this point, so a single translate covers it
+    return value.translate(None, _norm_strip)
 
 def getDeep(dictionary, keys, default=""):
     try:
@@ -113,6 +172,11 @@ def getTimeStamp(value):
     diff = value - datetime(1970, 1, 1)
     return int(diff.total_seconds()) #float to int conversion
 
+def json_default(obj):
+    if isinstance(obj, datetime):
+        return getTimeStamp(obj)
+    raise TypeError ("Type %s not serializable" % type(obj))
+
 # =====================================================================================================================
 # Database
 # =====================================================================================================================
@@ -136,6 +200,7 @@ class AnimeItem(object):
         self._watched = 0
         self._watched_server = 0
         self._available = {}
+        self._available_gen = {}  # episode -> scan generation that last saw its file
         self._updated = None
         self._datestart = None
         self._dateend = None
@@ -169,6 +234,7 @@ class AnimeItem(object):
         if value != self._title:
             self._title = value
             self._title_normalized = ""
+            self.reindex()
 
     @property
     def type(self):
@@ -322,7 +388,10 @@ class AnimeItem(object):
                 syn = syn.strip()
                 if syn:
                     arr.append(syn)
-        self._synonyms = arr
+        if arr != self._synonyms:
+            self._synonyms = arr
+            self._synonyms_normalized = []
+            self.reindex()
 
     @property
     def usersynonyms(self):
@@ -339,7 +408,10 @@ class AnimeItem(object):
                 syn = syn.strip()
                 if syn:
                     arr.append(syn)
-        self._usersyn = arr
+        if arr != self._usersyn:
+            self._usersyn = arr
+            self._usersyn_normalized = []
+            self.reindex()
 
     @property
     def synopsis(self):
@@ -484,14 +556,15 @@ class AnimeItem(object):
 
         return anime
 
-    def add_episode(self, episode, filename):
+    def add_episode(self, episode, filename, generation=0):
         try:
             value = int(episode)
             if value < 1:
                 return False
             if self.episodes > 0 and value > self.episodes:
                 return False
-            self._available[value] = filename
+            self._set_file(value, filename)
+            self._available_gen[value] = generation
             return True
         except ValueError:
             return False
@@ -500,46 +573,86 @@ class AnimeItem(object):
         try:
             value = int(episode)
             if value in self._available:
-                del self._available[value]
+                self._set_file(value, None)
                 return True
             return False
         except ValueError:
             return False
 
+    def sweep_episodes(self, generation, keep=()):
+        """Removes the episodes not seen by the given scan generation, except for files below the keep prefixes"""
+        stale = [value for value in self._available if self._available_gen.get(value, 0) < generation and
+                 not (keep and self._available[value].startswith(keep))]
+        for value in stale:
+            self._set_file(value, None)
+        return len(stale) > 0
+
+    def move_episodes(self, src, dest, folder=False):
+        """Moves the episodes stored at src, or below it for a folder, to dest. A dest of None removes them"""
+        prefix = os.path.join(src, "")
+        moved = []
+        for value, path in self._available.iteritems():
+            if path == src:
+                moved.append((value, dest))
+            elif folder and path.startswith(prefix):
+                moved.append((value, dest + path[len(src):] if dest is not None else None))
+
+        for value, path in moved:
+            self._set_file(value, path)
+        return len(moved) > 0
+
+    def _set_file(self, value, filename):
+        # Stores the file of an episode, or drops the episode for None, and keeps the database's file index in step
+        previous = self._available.get(value)
+        if filename is None:
+            self._available.pop(value, None)
+            self._available_gen.pop(value, None)
+        else:
+            self._available[value] = filename
+        if isinstance(self._db, AnimeDatabase) and previous != filename:
+            if previous is not None:
+                self._db.unindex_file(self, previous)
+            if filename is not None:
+                self._db.index_file(self, filename)
+
     def resetprogress(self):
         self._watched = 0
         self._watched_server = 0
 
-    def is_match(self, value):
-        """Returns True if the normalized string matches this database item"""
+    def reindex(self):
+        """Informs the owning database that the titles of this item have changed"""
+        if isinstance(self._db, AnimeDatabase):
+            self._db.reindex(self)
+
+    def normalized_titles(self):
+        """Returns the normalized title, synonyms and user synonyms for this item"""
         # Normalize title on demand
-        if not self._title_normalized:
+        if not self._title_normalized and self._title:
             self._title_normalized = normalize_title(self._title)
-        if value == self._title_normalized:
-            return True
-
-        # Normalize synonyms on demand
-        if self._synonyms:
-            # Service-Provided synonyms
-            if self._synonyms and not self._synonyms_normalized:
-                for syn in self._synonyms:
-                    norm = normalize_title(syn)
-                    if norm:  # If the unicode normalization translates to nothing, then dont write it
-                        self._synonyms_normalized.append(normalize_title(syn))
-
-            if value in self._synonyms_normalized:
-                return True
 
-            # User customized synonyms
-            if self._usersyn and not self._usersyn_normalized:
-                for syn in self._usersyn:
-                    norm = normalize_title(syn)
-                    if norm:  # If the unicode normalization translates to nothing, then dont write it
-                        self._usersyn_normalized.append(normalize_title(syn))
+        # Service-Provided synonyms
+        if self._synonyms and not self._synonyms_normalized:
+            for syn in self._synonyms:
+                norm = normalize_title(syn)
+                if norm:  # If the unicode normalization translates to nothing, then dont write it
+                    self._synonyms_normalized.append(norm)
+
+        # User customized synonyms
+        if self._usersyn and not self._usersyn_normalized:
+            for syn in self._usersyn:
+                norm = normalize_title(syn)
+                if norm:  # If the unicode normalization translates to nothing, then dont write it
+                    self._usersyn_normalized.append(norm)
+
+        titles = set(self._synonyms_normalized)
+        titles.update(self._usersyn_normalized)
+        if self._title_normalized:
+            titles.add(self._title_normalized)
+        return titles
 
-            if value in self._usersyn_normalized:
-                return True
-        return False
+    def is_match(self, value):
+        """Returns True if the normalized string matches this database item"""
+        return value in self.normalized_titles()
 
     def is_outofsync(self):
         """Returns True if the local progress of this item needs to be synced with MAL"""
@@ -560,20 +673,328 @@ class AnimeItem(object):
         self.watched_server = self.watched
 
 
+class PickleStore(object):
+    """Dictionary of entries kept in a versioned pickle file"""
+    version = 1
+
+    def __init__(self, store):
+        self._store = store
+        self._entries = {}
+        self._dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """Loads the entries from disk. A missing, unreadable or outdated file just starts out empty"""
+        self._entries = {}
+        self._dirty = False
+        try:
+            if not os.path.exists(self._store):
+                return
+            fs = open(self._store, "rb")
+            data = pickle.load(fs)
+            fs.close()
+            if data.get("version") == self.version:
+                self._entries = data.get("entries", {})
+        except Exception:
+            pass
+
+    def save(self):
+        """Saves the entries to disk, if they changed since they were loaded"""
+        if not self._dirty:
+            return
+        try:
+            fs = open(self._store, "wb")
+            pickle.dump({
+                "version": self.version,
+                "entries": self._entries
+            }, fs, pickle.HIGHEST_PROTOCOL)
+            fs.close()
+            self._dirty = False
+        except IOError:
+            pass
+
+
+class ParseCache(PickleStore):
+    """Remembers the title and episode range parsed from each library file, keyed by path, size and mtime"""
+    storeFile = "parse.bin"
+
+    def __init__(self, path):
+        # entries: path -> (size, mtime, title, start, end)
+        PickleStore.__init__(self, os.path.join(path, ParseCache.storeFile))
+
+    def get(self, path, size, mtime):
+        """Returns the cached (title, start, end) for the file, or None if it is unknown or has changed"""
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == size and entry[1] == mtime:
+            return entry[2:]
+        return None
+
+    def lookup(self, path):
+        """Returns the cached (title, start, end) for the file without checking it for changes, or None if unknown"""
+        entry = self._entries.get(path)
+        if entry is not None:
+            return entry[2:]
+        return None
+
+    def set(self, path, size, mtime, title, start, end):
+        self._entries[path] = (size, mtime, title, start, end)
+        self._dirty = True
+
+    def retain(self, paths, keep=()):
+        """Forgets every file that is not in the given paths, except for files below the keep prefixes"""
+        stale = [path for path in self._entries if path not in paths and not (keep and path.startswith(keep))]
+        for path in stale:
+            del self._entries[path]
+        if stale:
+            self._dirty = True
+
+
+class LibraryFilter(object):
+    """Decides which library files are worth parsing, by extension, ignored folder and ignored file pattern"""
+    defaultExtensions = [".mkv", ".mp4", ".avi", ".m4v", ".mov", ".wmv", ".ogm", ".webm", ".flv", ".ts", ".m2ts",
+                         ".mpg", ".mpeg", ".rmvb", ".divx", ".iso"]
+
+    def __init__(self):
+        self._extensions = frozenset(LibraryFilter.defaultExtensions)
+        self._folders = frozenset()
+        self._patterns = ()
+        self._re_patterns = None
+
+    @property
+    def extensions(self):
+        return self._extensions
+
+    @extensions.setter
+    def extensions(self, value):
+        """Accepts a list of extensions, each including the leading dot"""
+        self._extensions = frozenset(ext.lower() for ext in value if ext)
+
+    @property
+    def folders(self):
+        return self._folders
+
+    @folders.setter
+    def folders(self, value):
+        self._folders = frozenset(name.strip().lower() for name in value if name.strip())
+
+    @property
+    def patterns(self):
+        return self._patterns
+
+    @patterns.setter
+    def patterns(self, value):
+        """Accepts a list of file name globs, such as *sample*"""
+        self._patterns = tuple(glob.strip() for glob in value if glob.strip())
+        if self._patterns:
+            self._re_patterns = re.compile("|".join("(?:%s)" % fnmatch.translate(glob) for glob in self._patterns), re.I)
+        else:
+            self._re_patterns = None
+
+    def accepts_folder(self, name):
+        return name.lower() not in self._folders
+
+    def accepts_file(self, name):
+        if os.path.splitext(name)[1].lower() not in self._extensions:
+            return False
+        return self._re_patterns is None or not self._re_patterns.match(name)
+
+    def accepts_path(self, path, root, folder=False):
+        """Checks a file, and every folder between it and the library root. Setting folder checks a folder instead"""
+        if folder:
+            dirpath = path
+        else:
+            dirpath, name = os.path.split(path)
+            if not self.accepts_file(name):
+                return False
+        if self._folders:
+            relpath = os.path.relpath(dirpath, root)
+            if relpath != os.curdir:
+                for folder in relpath.split(os.sep):
+                    if not self.accepts_folder(folder):
+                        return False
+        return True
+
+
+class LibraryManifest(PickleStore):
+    """Remembers the modification time and contents of every folder in a library root"""
+    storeFile = "manifest-{0}.bin"
+    settle = 2  # seconds. Folders modified more recently than this are listed again on the next scan
+
+    def __init__(self, path, root):
+        key = hashlib.md5(root.encode("utf-8")).hexdigest()[:16]
+        self.complete = True  # False when the last walk could not read the root folder itself
+        self.unreadable = []  # folders below the root that the last walk could not list
+        # entries: folder path -> (mtime, subfolder names, file names)
+        PickleStore.__init__(self, os.path.join(path, LibraryManifest.storeFile.format(key)))
+
+    @staticmethod
+    def listdir(dirpath):
+        """Lists a folder, returning its (subfolder names, file names)"""
+        # Same as os.walk, symlinked folders are not followed, and entries that cannot be checked count as files
+        dirnames = []
+        filenames = []
+        if scandir is not None:
+            for entry in scandir(dirpath):
+                try:
+                    isdir = entry.is_dir()
+                except OSError:
+                    isdir = False
+                if not isdir:
+                    filenames.append(entry.name)
+                elif not entry.is_symlink():
+                    dirnames.append(entry.name)
+        else:
+            for name in os.listdir(dirpath):
+                path = os.path.join(dirpath, name)
+                if not os.path.isdir(path):
+                    filenames.append(name)
+                elif not os.path.islink(path):
+                    dirnames.append(name)
+        return dirnames, filenames
+
+    def scan(self, dirpath, full=False):
+        """Returns (mtime, dirnames, filenames, changed) for a folder, or None if it cannot be read"""
+        try:
+            mtime = os.stat(dirpath).st_mtime
+        except OSError:
+            return None
+
+        # Only list the folder if it changed. Called from the walk's worker threads, so the manifest is only read here
+        entry = self._entries.get(dirpath)
+        if not full and entry is not None and entry[0] == mtime:
+            return mtime, entry[1], entry[2], False
+
+        try:
+            dirnames, filenames = LibraryManifest.listdir(dirpath)
+        except OSError:
+            return None
+
+        # A folder that was modified within the mtime resolution of the file system may change again without its
+        # mtime changing, so do not trust it on the next scan
+        if time.time() - mtime < LibraryManifest.settle:
+            mtime = None
+        return mtime, dirnames, filenames, True
+
+    def walk(self, root, full=False, threads=1, libfilter=None):
+        """Walks the folder tree in os.walk order, yielding (dirpath, filenames, changed) for every folder"""
+        # With more than one thread, subfolders are scanned ahead while the caller works through the results
+        pool = WorkerPool(threads) if threads > 1 else None
+        seen = set()
+        self.complete = True
+        self.unreadable = []
+        try:
+            pending = [(root, pool.submit(self.scan, root, full) if pool else None)]
+            while pending:
+                dirpath, task = pending.pop()
+                result = task.result() if task else self.scan(dirpath, full)
+                if result is None:
+                    # Skipped along with everything below it, such as lost+found
+                    if dirpath == root:
+                        self.complete = False
+                    else:
+                        self.unreadable.append(dirpath)
+                    continue
+
+                mtime, dirnames, filenames, changed = result
+                if changed:
+                    self._entries[dirpath] = (mtime, dirnames, filenames)
+                    self._dirty = True
+                seen.add(dirpath)
+
+                if libfilter is not None:
+                    dirnames = [name for name in dirnames if libfilter.accepts_folder(name)]
+                subdirs = [os.path.join(dirpath, name) for name in dirnames]
+                tasks = [pool.submit(self.scan, subdir, full) if pool else None for subdir in subdirs]
+                pending.extend(reversed(zip(subdirs, tasks)))
+                yield dirpath, filenames, changed
+        finally:
+            if pool is not None:
+                pool.close()
+
+        # Forget the folders below root that were not reached
+        prefix = os.path.join(root, "")
+        stale = [dirpath for dirpath in self._entries
+                 if dirpath not in seen and (dirpath == root or dirpath.startswith(prefix))]
+        for dirpath in stale:
+            del self._entries[dirpath]
+        if stale:
+            self._dirty = True
+
+
+class LibraryRoot(object):
+    """A library folder with its own manifest, walked on its own thread during a scan"""
+    def __init__(self, profile, path):
+        self.path = path
+        self.prefix = os.path.join(os.path.abspath(path), "")  # every file below the root starts with this
+        self.manifest = LibraryManifest(profile, path)
+        self.busy = False  # a walk is still running, possibly left behind by a scan that gave up waiting on it
+
+    def contains(self, filepath):
+        return os.path.abspath(filepath).startswith(self.prefix)
+
+
 class AnimeDatabase(object):
     storeFile = "db.json"
+    journalFile = "db.journal"  # items changed since the store was written, one json record per line
+    compactMinimum = 100  # journal records written before the journal may be folded back into the store
+    scanBatch = 1024  # files resolved per step while the library walk is still running
+    progressInterval = 5  # seconds between progress reports during a scan
+    rootTimeout = 30  # seconds a scan waits on a library root that stopped responding
 
-    def __init__(self, path, service, library):
+    def __init__(self, path, service, libraries):
         #internal
         self._ant = Anitomy()
+        self._ant.parse_extras = False  # only the title and episode are used, so skip the remaining stages
+        self._ant.parse_fast = True
         self._dbstore = os.path.join(path, AnimeDatabase.storeFile)
+        self._journal = os.path.join(path, AnimeDatabase.journalFile)
+        self._storeservice = None  # service of the items in the store
+        self._saved = {}           # item id -> json record last written for it
+        self._journalcount = 0     # records in the journal files
+        self._savelock = Lock()
+        self._compactor = None     # thread writing the store
         self._db = {}
-        self._library = unicode(library) #py2: force unicode, so that os.walk will properly handle unicode filenames
+        self._index = {}     # normalized title -> list of matching items
+        self._indexkeys = {} # item id -> normalized titles the item is currently indexed under
+        self._files = {}     # file path -> ids of the items with an episode stored at it
+        self._found = LRUCache(4096)  # normalized title -> matched item, or None when nothing matched
+        self._profile = path
+        self._libraries = []
+        self._roots = {}     # library folder -> LibraryRoot
         self._updatelist = deque()
         self._service = service
+        self._parsecache = ParseCache(path)
+        self._scanprocesses = 0
+        self._scanthreads = 1
+        self._generation = 0  # bumped by every library scan, to sweep out episodes whose files are gone
+        self._filter = LibraryFilter()
 
         #init
+        self.libraries = libraries
         self.load()
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        del d['_parsecache'] # only the service scans the library, so keep these out of the ipc jar
+        del d['_roots']
+        del d['_files']
+        del d['_saved']      # only the service saves the database
+        del d['_savelock']   # locks cannot be pickled
+        del d['_compactor']
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._parsecache = None
+        self._roots = {}
+        self._files = {}
+        self._saved = {}
+        self._savelock = Lock()
+        self._compactor = None
+
     def __iter__(self):
         for id in self._db:
             yield id
@@ -592,120 +1013,268 @@ class AnimeDatabase(object):
     def service(self, value):
         """Switch service handler. Empties the database and removes all queued updates"""
         if value != self._service and isinstance(value, AnimeService):
-            self._db.clear()
+            self.clear()
             self._updatelist.clear()
             self._service = value
 
     def load(self):
-        """Loads the database from disk"""
-        try:
-            #A valid service handler must be bound to the database before any load will be accepted
-            if not isinstance(self.service, AnimeService):
-                return
-            if not os.path.exists(self._dbstore):
-                return
-            fp = open(self._dbstore, "r")
-            data = json.load(fp)
-            fp.close()
-
-            #Ensure the loaded db matches the active service. If not, then the load will be aborted, resulting in an empty db
-            serviceid = data.get("service")
-            if serviceid != self.service.id:
-                return
-
-            self._db.clear()
-            for anime in data.get("items"):
-                key = anime.get("id")
-                if key in self._db:
-                    self._db[key].update(anime)
-                else:
-                    dbitem = AnimeItem.createFromItem(self, anime)
-                    self.add_anime(dbitem)
-
-                    # If the item requires additional data, then add it to the update list for later processing
-                    if self.service.requiresAsyncFetch(dbitem):
-                        if dbitem.status == WATCHING or dbitem.status == PLANTOWATCH:
-                            # Give priority to shows that are most likely to be viewed first
-                            self._updatelist.append(dbitem)
-                        else:
-                            self._updatelist.appendleft(dbitem)
+        """Loads the database from disk: the items in the store, followed by the changes in the journal"""
+        #A valid service handler must be bound to the database before any load will be accepted
+        if not isinstance(self.service, AnimeService):
+            return
 
+        records = OrderedDict()
+        self._storeservice = None
+        store = self._dbstore
+        if not os.path.exists(store) and os.path.exists(store + ".tmp"):
+            store += ".tmp"  # the service stopped while the store was being replaced
+        try:
+            if os.path.exists(store):
+                fp = open(store, "r")
+                data = json.load(fp)
+                fp.close()
+
+                #Ensure the loaded db matches the active service. If not, then the items are skipped, resulting in an empty db
+                self._storeservice = data.get("service")
+                if self._storeservice == self.service.id:
+                    for anime in data.get("items"):
+                        records[anime.get("id")] = anime
         except ValueError:
             #In py2, deserializing errors raise ValueError
             pass
         except IOError:
             pass
 
+        # Replay the journal, including one that was set aside by a compaction that did not finish. Records hold the
+        # whole item, so replaying one that the store already has changes nothing
+        self._journalcount = 0
+        for path in (self._journal + ".old", self._journal):
+            try:
+                fp = open(path, "rb")
+                data = fp.read()
+                fp.close()
+            except IOError:
+                continue
+
+            # A record cut short when the service stopped mid-write is dropped from the file, so that the next save
+            # does not append its first record to the partial line. The complete records are replayed either way
+            end = data.rfind("\n") + 1
+            if end < len(data):
+                try:
+                    fp = open(path, "r+b")
+                    fp.truncate(end)
+                    fp.close()
+                except IOError, e:
+                    self.service.log("Could not drop a partial journal record: " + str(e))
+            for line in data[:end].splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._journalcount += 1
+                if record.get("service") != self.service.id:
+                    continue
+                if "removed" in record:
+                    records.pop(record["removed"], None)
+                else:
+                    records[record["item"].get("id")] = record["item"]
+
+        self.clear()
+        for anime in records.itervalues():
+            dbitem = AnimeItem.createFromItem(self, anime)
+            self.add_anime(dbitem)
+
+            # If the item requires additional data, then add it to the update list for later processing
+            if self.service.requiresAsyncFetch(dbitem):
+                if dbitem.status == WATCHING or dbitem.status == PLANTOWATCH:
+                    # Give priority to shows that are most likely to be viewed first
+                    self._updatelist.append(dbitem)
+                else:
+                    self._updatelist.appendleft(dbitem)
+        self._saved = dict((key, AnimeDatabase.record(item)) for key, item in self._db.iteritems())
+
     def fetch(self):
         """Syncs the database with the active service"""
         if not isinstance(self.service, AnimeService):
             return False
         return self.service.fetch(self)
 
-    def save(self):
-        """Saves the database to disk"""
+    @staticmethod
+    def record(item):
+        """Returns the json record of an item, as it is written to disk"""
+        return json.dumps(item.save(), default=json_default, sort_keys=True)
 
-        def json_default(obj):
-            if isinstance(obj, datetime):
-                return getTimeStamp(obj)
-            raise TypeError ("Type %s not serializable" % type(obj))
+    def save(self):
+        """Saves the items that changed since the last save to the journal"""
+        with self._savelock:
+            try:
+                service = json.dumps(self.service.id)
+                records = dict((key, AnimeDatabase.record(item)) for key, item in self._db.iteritems())
+                if self._storeservice != self.service.id:
+                    # New store, or the service changed. Journal records of the previous service must not survive
+                    if not self.compact(records, False):
+                        return
+                else:
+                    changes = ['{{"service": {0}, "item": {1}}}\n'.format(service, record)
+                               for key, record in records.iteritems() if self._saved.get(key) != record]
+                    changes.extend('{{"service": {0}, "removed": {1}}}\n'.format(service, json.dumps(key))
+                                   for key in self._saved if key not in records)
+                    if changes:
+                        fp = open(self._journal, "a")
+                        fp.write("".join(changes))
+                        fp.close()
+                        self._journalcount += len(changes)
+                    # Once the journal outgrows the database, fold it back into the store on a background thread
+                    if self._journalcount > max(AnimeDatabase.compactMinimum, len(records)):
+                        self.compact(records, True)
+                self._saved = records
+            except (IOError, OSError):
+                pass
+
+    def compact(self, records, background=True):
+        """Writes every item to the store and drops the journal. Returns False if the store could not be written"""
+        if self._compactor is not None:
+            if background and self._compactor.is_alive():
+                return True
+            self._compactor.join()
+            self._compactor = None
+
+        data = '{{"service": {0}, "items": [{1}]}}'.format(json.dumps(self.service.id), ", ".join(records.itervalues()))
+        pending = self._journal + ".old"
+        if background and not os.path.exists(pending):
+            # Move the journal aside, so that saves made while the store is written go to a fresh journal
+            if os.path.exists(self._journal):
+                os.rename(self._journal, pending)
+            self._compactor = Thread(target=self._write_store, args=(data, [pending]))
+            self._compactor.start()
+        elif not self._write_store(data, [pending, self._journal]):
+            return False
+        self._storeservice = self.service.id
+        self._journalcount = 0
+        return True
 
+    def _write_store(self, data, journals):
+        """Replaces the store with data, then removes the journals it covers"""
         try:
-            items = []
-            for key, item in self._db.iteritems():
-                obj = item.save()
-                items.append(obj)
-
-            fp = open(self._dbstore, "w")
-            json.dump({
-                "service": self.service.id,
-                "items"  : items
-            }, fp, default=json_default)
-            fp.close()
-        except IOError:
-            pass
+            atomic_write(self._dbstore, data, "w")
+            for path in journals:
+                if os.path.exists(path):
+                    os.remove(path)
+            return True
+        except (IOError, OSError):
+            return False  # the journals are kept, so nothing is lost
+
+    def clear(self):
+        """Removes all items from the database"""
+        self._db.clear()
+        self._index.clear()
+        self._indexkeys.clear()
+        self._files.clear()
+        self._found.clear()
 
     def find(self, name):
         """Finds a database item based on the series title"""
         title = normalize_title(name)
-        for key, item in self._db.iteritems():
-            if item.is_match(title):
-                return item
-        return None
+        item = self._found.get(title, False)
+        if item is False:
+            items = self._index.get(title)
+            item = items[0] if items else None
+            self._found.set(title, item)
+        return item
+
+    def cachestats(self):
+        """Returns a summary of how well the title caches are performing"""
+        return "normalize: {0}; lookup: {1}".format(title_cache.stats(), self._found.stats())
+
+    def reindex(self, anime):
+        """Rebuilds the title index entries for a single item"""
+        if self._db.get(anime.id) is not anime:
+            return
+
+        self._unindex(anime)
+        self._found.clear()
+        titles = anime.normalized_titles()
+        for title in titles:
+            items = self._index.get(title)
+            if items is None:
+                self._index[title] = [anime]
+            else:
+                items.append(anime)
+        self._indexkeys[anime.id] = titles
+
+    def index_file(self, anime, path):
+        """Records that an episode of the item is stored at the file"""
+        self._files.setdefault(path, set()).add(anime.id)
+
+    def unindex_file(self, anime, path, force=False):
+        """Forgets the file for the item, unless another of its episodes is still stored there"""
+        if not force and path in anime.available.itervalues():
+            return
+        ids = self._files.get(path)
+        if ids is not None:
+            ids.discard(anime.id)
+            if not ids:
+                del self._files[path]
+
+    def _unindex(self, anime):
+        for title in self._indexkeys.pop(anime.id, ()):
+            items = self._index.get(title)
+            if items is None:
+                continue
+            items[:] = [item for item in items if item is not anime]
+            if not items:
+                del self._index[title]
+
+    def parse(self, filename):
+        """Extracts the title and episode range from the file name. Files without a valid episode return a zero start"""
+        # The parsed elements are local to this call, as the playback, scan and folder monitoring threads all resolve
+        #   files through the same parser
+        return AnimeDatabase.episodes_of(self._ant.parse_summary(filename))
+
+    @staticmethod
+    def episodes_of(summary):
+        # only care about files that have a declared episode number or range, where the start episode is valid
+        if summary is not None and summary[1] > 0:
+            return summary[0], summary[1], summary[2]
+        return "", 0, 0
+
+    def parse_file(self, filepath):
+        """Same as parse, but reuses the cached result if the file has not changed since it was last parsed"""
+        return self.parse_files([filepath])[0]
+
+    def parse_files(self, filepaths, pool=None):
+        """Parses a batch of files, reusing cached results for unchanged files and the processes of a ParsePool"""
+        results = [None] * len(filepaths)
+        pending = []
+        for idx, filepath in enumerate(filepaths):
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                pending.append((idx, None))
+                continue
+
+            cached = self._parsecache.get(filepath, st.st_size, st.st_mtime)
+            if cached is not None:
+                results[idx] = cached
+            else:
+                pending.append((idx, st))
+
+        if pending:
+            names = [os.path.basename(filepaths[idx]) for idx, st in pending]
+            summaries = self._ant.parse_many(names, self._scanprocesses, pool=pool)
+            for (idx, st), summary in zip(pending, summaries):
+                result = AnimeDatabase.episodes_of(summary)
+                if st is not None:
+                    self._parsecache.set(filepaths[idx], st.st_size, st.st_mtime, *result)
+                results[idx] = result
+        return results
 
     def resolve(self, filename):
         """Finds a database item, and its episode number, based on the file name"""
-        # Extract the anime title from the file
-        if self._ant.parse(filename):
-            # only care about files that have a declared episode number or range
-            if kElementEpisodeNumber in self._ant.elements:
-                # normalize the title, then attempt to find it in the database
-                title = self._ant.elements[kElementAnimeTitle]
-                episodes = self._ant.elements[kElementEpisodeNumber]
-
-                # Anitomy returns episodes as a string, so they must be converted
-                # If the file is a single episode the value will be a string, otherwise a list of two strings
-                if isinstance(episodes, list):
-                    try:
-                        start = int(episodes[0])
-                    except ValueError:
-                        start = 0
-
-                    try:
-                        end = int(episodes[1])
-                    except ValueError:
-                        end = start
-                else:
-                    try:
-                        start = int(episodes)
-                        end = start
-                    except ValueError:
-                        start = 0
-                        end = 0
-
-                # If the start episode is invalid, then discard this file
-                if start > 0:
-                    return self.find(title), title, start, end
+        title, start, end = self.parse(filename)
+        if start > 0:
+            # normalize the title, then attempt to find it in the database
+            return self.find(title), title, start, end
         return None, "", 0, 0
 
     def add_anime(self, anime):
@@ -714,7 +1283,19 @@ class AnimeDatabase(object):
             return False
         if not anime.id:
             return False
+
+        previous = self._db.get(anime.id)
+        if previous is not None:
+            self._unindex(previous)
+            for path in set(previous.available.itervalues()):
+                self.unindex_file(previous, path, True)
+
+        anime._db = self
         self._db[anime.id] = anime
+        self.reindex(anime)
+        for path in anime.available.itervalues():
+            self.index_file(anime, path)
+        return True
 
     def map_episode(self, anime, episode):
         # If there is a mapped episode redirection, then calculate the new episode and return the new entry
@@ -726,16 +1307,57 @@ class AnimeDatabase(object):
 
     def add_episode(self, filepath):
         """Determines the series and episode from the file name, and marks it as available"""
+        if not self.accepts(filepath):
+            return False
         item, title, start, end = self.resolve(os.path.basename(filepath))
         if item is not None:
             # Mark episode(s) as available
             abspath = os.path.abspath(filepath)
             for episode in range(start, end+1):
                 mappeditem, mappedepi = self.map_episode(item, episode)
-                mappeditem.add_episode(mappedepi, abspath)
+                mappeditem.add_episode(mappedepi, abspath, self._generation)
             return True
         return False
 
+    def accepts(self, path, folder=False):
+        """Checks whether the file, or the folder when folder is set, is part of the library according to the filter"""
+        root = self.root_of(path)
+        if root is None:
+            return not folder and self._filter.accepts_path(path, os.path.dirname(path))
+        return self._filter.accepts_path(path, root.path, folder)
+
+    def move_episode(self, src, dest):
+        """Follows a file that was moved or renamed"""
+        src = os.path.abspath(src)
+        dest = os.path.abspath(dest)
+        if not self.accepts(dest):
+            return self._move_paths(src, None, False)
+        # A move that keeps the file name only has its path rewritten
+        if os.path.basename(src) == os.path.basename(dest) and self._move_paths(src, dest, False):
+            return True
+
+        # Renamed, or not known yet, such as a download that was renamed from a partial file
+        removed = self._move_paths(src, None, False)
+        return self.add_episode(dest) or removed
+
+    def move_folder(self, src, dest):
+        """Follows a folder that was moved or renamed, without parsing anything again"""
+        src = os.path.abspath(src)
+        dest = os.path.abspath(dest)
+        return self._move_paths(src, dest if self.accepts(dest, True) else None, True)
+
+    def _move_paths(self, src, dest, folder):
+        if folder:
+            items = self._db.itervalues()
+        else:
+            # A single file only concerns the items that have it, which the file index knows without checking them all
+            items = [self._db[key] for key in self._files.get(src, ()) if key in self._db]
+        moved = False
+        for item in items:
+            if item.move_episodes(src, dest, folder):
+                moved = True
+        return moved
+
     def remove_episode(self, filepath):
         """Determines the series and episode from the file name, and marks it as unavailable"""
         item, title, start, end = self.resolve(os.path.basename(filepath))
@@ -747,33 +1369,198 @@ class AnimeDatabase(object):
             return True
         return False
 
-    def find_episodes(self):
-        """Crawls the library folder to look for available episodes"""
+    def find_episodes(self, full=False, progress=None, paths=None):
+        """Crawls the library folders, or only the given ones, to look for available episodes"""
         foundany = False
-        if os.path.isdir(self._library):
-            # Grab all the files
-            for (dirpath, dirnames, filenames) in os.walk(self._library):
-                for filename in filenames:
-                    item, title, start, end = self.resolve(filename)
-                    if item is not None:
-                        # Mark episode(s) as available
-                        abspath = os.path.abspath(os.path.join(dirpath, filename))
-                        for episode in range(start, end + 1):
-                            mappeditem, mappedepi = self.map_episode(item, episode)
-                            if mappeditem.add_episode(mappedepi, abspath):
-                                foundany = True
+        self._generation += 1
+        generation = self._generation  # another scan may bump the counter before this one sweeps
+
+        # Every root is walked on its own thread, which feeds its folders through the queue
+        queue = Queue()
+        walking = set()
+        skipped = []  # roots that timed out or could not be read at all, so their episodes must survive the sweep
+        for path in self._libraries:
+            root = self._roots[path]
+            if root.busy or (paths is not None and path not in paths):
+                skipped.append(root)
+                continue
+            root.busy = True
+            t = Thread(target=self._walk_root, args=(root, full, queue))
+            t.daemon = True
+            t.start()
+            walking.add(root)
+
+        # Files are resolved in batches while the walks continue. Files in unchanged folders reuse their previous
+        # results without being checked. The batches share one set of parse processes, started once a batch needs it
+        pool = ParsePool(self._ant, self._scanprocesses) if self._scanprocesses > 1 else None
+        try:
+            files = set()
+            batch = []
+            reported = time.time()
+            unreported = False
+            while walking:
+                try:
+                    root, folder = queue.get(timeout=AnimeDatabase.rootTimeout)
+                except Empty:
+                    # The remaining roots stopped responding. Leave their walks to finish in the background
+                    skipped.extend(walking)
+                    break
+
+                if folder is None:
+                    # Folders that could not be listed are simply not in the manifest, so it is worth keeping either way
+                    walking.discard(root)
+                    root.manifest.save()
+                    if not root.manifest.complete:
+                        skipped.append(root)
+                    continue
+
+                entries = self._collect(*folder)
+                files.update(abspath for abspath, result in entries)
+                batch.extend(entries)
+
+                due = progress is not None and time.time() - reported >= AnimeDatabase.progressInterval
+                if len(batch) >= AnimeDatabase.scanBatch or due:
+                    if self._add_batch(batch, generation, pool):
+                        foundany = unreported = True
+                    batch = []
+                if due:
+                    if unreported:
+                        progress()
+                        unreported = False
+                    reported = time.time()
+            foundany = self._add_batch(batch, generation, pool) or foundany
+        finally:
+            if pool is not None:
+                pool.close()
+
+        # Sweep out episodes whose files were not seen by this scan. Roots that were not read, and folders that could
+        # not be listed, are left alone, since their files would look deleted
+        keep = tuple(root.prefix for root in skipped)
+        for path in self._libraries:
+            root = self._roots[path]
+            if root not in skipped:
+                keep += tuple(os.path.join(os.path.abspath(dirpath), "") for dirpath in root.manifest.unreadable)
+        for item in self._db.itervalues():
+            if item.sweep_episodes(generation, keep):
+                foundany = True
+
+        # Drop files that are no longer in the library, then persist whatever was parsed. Cached files below the same
+        # prefixes are kept, as they were not seen either
+        self._parsecache.retain(files, keep)
+        self._parsecache.save()
+        return foundany
+
+    def scan_folder(self, path):
+        """Scans one folder and everything below it. Returns None if the folder was refused"""
+        root = self.root_of(path)
+        if root is None or root.busy or not self.accepts(path, True):
+            return None
+
+        batch = []
+        for folder in root.manifest.walk(os.path.abspath(path), False, self._scanthreads, self._filter):
+            batch.extend(self._collect(*folder))
+        foundany = self._add_batch(batch, self._generation)  # nothing is swept, as the rest of the library was not seen
+
+        root.manifest.save()
+        self._parsecache.save()
         return foundany
 
+    def remove_folder(self, path):
+        """Marks every episode below a deleted folder as unavailable, without parsing anything"""
+        return self._move_paths(os.path.abspath(path), None, True)
+
+    def _collect(self, dirpath, filenames, changed):
+        """Returns (filepath, cached parse result or None) for the accepted files of a walked folder"""
+        entries = []
+        for filename in filenames:
+            if not self._filter.accepts_file(filename):
+                continue
+            abspath = os.path.abspath(os.path.join(dirpath, filename))
+            entries.append((abspath, None if changed else self._parsecache.lookup(abspath)))
+        return entries
+
+    def _walk_root(self, root, full, queue):
+        """Walks one library root on its own thread, queueing every folder, then (root, None) once done"""
+        try:
+            if os.path.isdir(root.path):
+                for folder in root.manifest.walk(root.path, full, self._scanthreads, self._filter):
+                    queue.put((root, folder))
+            else:
+                root.manifest.complete = False
+        except Exception:
+            root.manifest.complete = False
+        finally:
+            root.busy = False
+            queue.put((root, None))
+
+    def root_of(self, filepath):
+        """Returns the LibraryRoot that holds the file, or None if it is outside of the library"""
+        for path in self._libraries:
+            root = self._roots.get(path)
+            if root is not None and root.contains(filepath):
+                return root
+        return None
+
+    def _add_batch(self, batch, generation, pool=None):
+        """Marks the episodes in a batch of (filepath, parse result) as available, parsing the files without a result"""
+        pending = [idx for idx, (abspath, result) in enumerate(batch) if result is None]
+        parsed = dict(zip(pending, self.parse_files([batch[idx][0] for idx in pending], pool)))
+
+        foundany = False
+        for idx, (abspath, result) in enumerate(batch):
+            title, start, end = parsed[idx] if result is None else result
+            if start < 1:
+                continue
+
+            item = self.find(title)
+            if item is not None:
+                # Mark episode(s) as available
+                for episode in range(start, end + 1):
+                    mappeditem, mappedepi = self.map_episode(item, episode)
+                    if mappeditem.add_episode(mappedepi, abspath, generation):
+                        foundany = True
+        return foundany
+
+    @property
+    def scanprocesses(self):
+        """Number of worker processes used to parse file names during a scan. Zero or one parses in the service"""
+        return self._scanprocesses
+
+    @scanprocesses.setter
+    def scanprocesses(self, value):
+        try:
+            self._scanprocesses = max(0, int(value))
+        except ValueError:
+            pass
+
+    @property
+    def filter(self):
+        """LibraryFilter that picks the files and folders to scan. Changes take effect on the next scan"""
+        return self._filter
+
+    @property
+    def scanthreads(self):
+        """Number of threads used to list library folders during a scan. One lists them in the calling thread"""
+        return self._scanthreads
+
+    @scanthreads.setter
+    def scanthreads(self, value):
+        try:
+            self._scanthreads = max(1, int(value))
+        except ValueError:
+            pass
+
     @property
-    def library(self):
-        return self._library
+    def libraries(self):
+        return self._libraries
 
-    @library.setter
-    def library(self, value):
-        # Force unicode for the library path, so that os walk returns unicode strings
-        value = unicode(value)
-        if value != self._library:
-            self._library = value
+    @libraries.setter
+    def libraries(self, value):
+        # Force unicode for the library paths, so that os walk returns unicode strings
+        value = [unicode(path) for path in value if path]
+        if value != self._libraries:
+            self._libraries = value
+            self._roots = dict((path, self._roots.get(path) or LibraryRoot(self._profile, path)) for path in value)
 
     @property
     def user(self):
@@ -782,7 +1569,7 @@ class AnimeDatabase(object):
     @user.setter
     def user(self, value):
         if value != self._user:
-            self._db.clear()
+            self.clear()
             self._user = value
 
     @property
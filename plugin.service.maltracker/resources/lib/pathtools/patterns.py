@@ -32,14 +32,18 @@ Functions
 .. autofunction:: match_path
 .. autofunction:: match_path_against
 .. autofunction:: filter_paths
+.. autoclass:: PatternMatcher
 """
 
-from fnmatch import fnmatch, fnmatchcase
+import os.path
+import re
+from fnmatch import fnmatch, fnmatchcase, translate
 
 __all__ = ['match_path',
            'match_path_against',
            'match_any_paths',
-           'filter_paths']
+           'filter_paths',
+           'PatternMatcher']
 
 
 def _string_lower(s):
@@ -263,3 +267,96 @@ def match_any_paths(pathnames,
         if _match_path(pathname, included, excluded, case_sensitive):
             return True
     return False
+
+
+class PatternMatcher(object):
+    """
+    Compiled form of :func:`match_any_paths`, for matching many paths
+    against the same patterns. Patterns of the form ``*.ext`` become a set
+    of extensions, so a path is checked against all of them with one
+    lookup. Any other pattern is compiled to a regular expression once.
+
+    :param included_patterns:
+        Allow filenames matching wildcard patterns specified in this list.
+        If no pattern list is specified, ["*"] is used as the default pattern,
+        which matches all files.
+    :param excluded_patterns:
+        Ignores filenames matching wildcard patterns specified in this list.
+        If no pattern list is specified, no files are ignored.
+    :param case_sensitive:
+        ``True`` if matching should be case-sensitive; ``False`` otherwise.
+    :raises:
+        ValueError if included patterns and excluded patterns contain the
+        same pattern.
+
+    Doctests::
+        >>> matcher = PatternMatcher(["*.py", "*.conf"], ["*.status"], case_sensitive=False)
+        >>> matcher.match("/users/gorakhargosh/FOOBAR.PY")
+        True
+        >>> matcher.match_any(["/var/cache/pdnsd.status", "/usr/local/bin/python"])
+        False
+    """
+
+    def __init__(self, included_patterns=None, excluded_patterns=None,
+                 case_sensitive=True):
+        included = ["*"] if included_patterns is None else included_patterns
+        excluded = [] if excluded_patterns is None else excluded_patterns
+        self._case_sensitive = case_sensitive
+        if not case_sensitive:
+            included = set(map(self._transform, included))
+            excluded = set(map(self._transform, excluded))
+        else:
+            included = set(included)
+            excluded = set(excluded)
+        common_patterns = included & excluded
+        if common_patterns:
+            raise ValueError('conflicting patterns `%s` included and excluded'\
+                             % common_patterns)
+        self._included = self._compile(included)
+        self._excluded = self._compile(excluded)
+
+    @staticmethod
+    def _transform(s):
+        # Same as fnmatch does for case-insensitive matching
+        return os.path.normcase(s.lower())
+
+    @staticmethod
+    def _compile(patterns):
+        extensions = set()
+        regexes = []
+        for pattern in patterns:
+            ext = pattern[1:]
+            if pattern.startswith("*.") and not re.search(r"[*?\[./\\]", ext[1:]):
+                extensions.add(ext)
+            else:
+                regexes.append(re.compile(translate(pattern)).match)
+        return extensions, regexes
+
+    @staticmethod
+    def _search(pathname, compiled):
+        extensions, regexes = compiled
+        if extensions and pathname[pathname.rfind("."):] in extensions:
+            return True
+        for match in regexes:
+            if match(pathname):
+                return True
+        return False
+
+    def match(self, pathname):
+        """
+        Returns ``True`` if the pathname matches an included pattern, and
+        no excluded pattern.
+        """
+        if not self._case_sensitive:
+            pathname = self._transform(pathname)
+        return (self._search(pathname, self._included)
+                and not self._search(pathname, self._excluded))
+
+    def match_any(self, pathnames):
+        """
+        Returns ``True`` if any of the pathnames matches.
+        """
+        for pathname in pathnames:
+            if self.match(pathname):
+                return True
+        return False
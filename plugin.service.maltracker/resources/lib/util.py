@@ -1,5 +1,126 @@
+import os
+from collections import OrderedDict
+from threading import Lock, Thread, Event
+from Queue import Queue, Empty
+
 def int2(value, default=0):
     try:
         return int(value)
     except ValueError:
-        return default
\ No newline at end of file
+        return default
+
+def atomic_write(path, data, mode="wb"):
+    """Replaces the file with data, through a temporary file, so that it is never left partially written"""
+    tmp = path + ".tmp"
+    fp = open(tmp, mode)
+    fp.write(data)
+    fp.close()
+    if os.name == "nt" and os.path.exists(path):
+        os.remove(path)  # rename cannot replace an existing file on windows
+    os.rename(tmp, path)
+
+class LRUCache(object):
+    """Size bounded mapping that discards the least recently used entry, and counts lookup hits and misses"""
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        del d['_lock'] # locks cannot be pickled
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items[key] = value  # move to the most recently used end
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        ratio = float(self.hits) / total * 100 if total else 0.0
+        return "{0} hits, {1} misses ({2:.1f}%), {3}/{4} entries".format(self.hits, self.misses, ratio, len(self._items), self.size)
+
+class Task(object):
+    """Call submitted to a WorkerPool. result() waits for it to finish, and re-raises anything it raised"""
+    def __init__(self, fn, args):
+        self._fn = fn
+        self._args = args
+        self._done = Event()
+        self._result = None
+        self._error = None
+
+    def run(self):
+        try:
+            self._result = self._fn(*self._args)
+        except Exception, e:
+            self._error = e
+        self._done.set()
+
+    def result(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+class WorkerPool(object):
+    """Fixed number of daemon threads that run submitted calls in submission order"""
+    def __init__(self, threads):
+        self._queue = Queue()
+        self._threads = []
+        for i in range(max(1, threads)):
+            t = Thread(target=self._run)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            task.run()
+
+    def submit(self, fn, *args):
+        task = Task(fn, args)
+        self._queue.put(task)
+        return task
+
+    def close(self):
+        """Drops calls that have not started yet, and stops the threads once they finish their current call"""
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Empty:
+            pass
+        for t in self._threads:
+            self._queue.put(None)
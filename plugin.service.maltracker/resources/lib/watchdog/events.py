@@ -64,6 +64,10 @@ Event Classes
    :members:
    :show-inheritance:
 
+.. autoclass:: OverflowEvent
+   :members:
+   :show-inheritance:
+
 
 Event Handler Classes
 ---------------------
@@ -88,7 +92,7 @@ Event Handler Classes
 import os.path
 import logging
 import re
-from pathtools.patterns import match_any_paths
+from pathtools.patterns import PatternMatcher
 from watchdog.utils import has_attribute
 from watchdog.utils import unicode_paths
 
@@ -97,6 +101,7 @@ EVENT_TYPE_MOVED = 'moved'
 EVENT_TYPE_DELETED = 'deleted'
 EVENT_TYPE_CREATED = 'created'
 EVENT_TYPE_MODIFIED = 'modified'
+EVENT_TYPE_OVERFLOW = 'overflow'
 
 
 class FileSystemEvent(object):
@@ -306,6 +311,25 @@ class DirMovedEvent(FileSystemMovedEvent):
                           dest_path=self.dest_path))
 
 
+class OverflowEvent(FileSystemEvent):
+    """
+    File system event representing lost events. The backend could not keep
+    up, so changes below the watched directory ``src_path`` may have been
+    missed, and anything cached about it should be checked again.
+    """
+
+    event_type = EVENT_TYPE_OVERFLOW
+    is_directory = True
+
+    def __init__(self, src_path):
+        super(OverflowEvent, self).__init__(src_path)
+
+    def __repr__(self):
+        return ("<%(class_name)s: src_path=%(src_path)r>"
+                ) % (dict(class_name=self.__class__.__name__,
+                          src_path=self.src_path))
+
+
 class FileSystemEventHandler(object):
     """
     Base file system event handler that you can override methods from.
@@ -325,6 +349,7 @@ class FileSystemEventHandler(object):
             EVENT_TYPE_MOVED: self.on_moved,
             EVENT_TYPE_CREATED: self.on_created,
             EVENT_TYPE_DELETED: self.on_deleted,
+            EVENT_TYPE_OVERFLOW: self.on_overflow,
         }
         event_type = event.event_type
         _method_map[event_type](event)
@@ -374,6 +399,15 @@ class FileSystemEventHandler(object):
             :class:`DirModifiedEvent` or :class:`FileModifiedEvent`
         """
 
+    def on_overflow(self, event):
+        """Called when events below a watched directory were lost.
+
+        :param event:
+            Event representing the lost events.
+        :type event:
+            :class:`OverflowEvent`
+        """
+
 
 class PatternMatchingEventHandler(FileSystemEventHandler):
     """
@@ -388,6 +422,8 @@ class PatternMatchingEventHandler(FileSystemEventHandler):
         self._ignore_patterns = ignore_patterns
         self._ignore_directories = ignore_directories
         self._case_sensitive = case_sensitive
+        self._matcher = PatternMatcher(patterns, ignore_patterns,
+                                       case_sensitive)
 
     @property
     def patterns(self):
@@ -430,19 +466,14 @@ class PatternMatchingEventHandler(FileSystemEventHandler):
         :type event:
             :class:`FileSystemEvent`
         """
+        if event.event_type == EVENT_TYPE_OVERFLOW:
+            # Not about any one path, so patterns do not apply
+            FileSystemEventHandler.dispatch(self, event)
+            return
         if self.ignore_directories and event.is_directory:
             return
 
-        paths = []
-        if has_attribute(event, 'dest_path'):
-            paths.append(unicode_paths.decode(event.dest_path))
-        if event.src_path:
-            paths.append(unicode_paths.decode(event.src_path))
-
-        if match_any_paths(paths,
-                           included_patterns=self.patterns,
-                           excluded_patterns=self.ignore_patterns,
-                           case_sensitive=self.case_sensitive):
+        if self.matches(event):
             self.on_any_event(event)
             _method_map = {
                 EVENT_TYPE_MODIFIED: self.on_modified,
@@ -453,6 +484,21 @@ class PatternMatchingEventHandler(FileSystemEventHandler):
             event_type = event.event_type
             _method_map[event_type](event)
 
+    def matches(self, event):
+        """Determines whether any path of the event matches the patterns.
+
+        :param event:
+            The event object representing the file system event.
+        :type event:
+            :class:`FileSystemEvent`
+        """
+        paths = []
+        if has_attribute(event, 'dest_path'):
+            paths.append(unicode_paths.decode(event.dest_path))
+        if event.src_path:
+            paths.append(unicode_paths.decode(event.src_path))
+        return self._matcher.match_any(paths)
+
 
 class RegexMatchingEventHandler(FileSystemEventHandler):
     """
@@ -513,6 +559,10 @@ class RegexMatchingEventHandler(FileSystemEventHandler):
         :type event:
             :class:`FileSystemEvent`
         """
+        if event.event_type == EVENT_TYPE_OVERFLOW:
+            # Not about any one path, so patterns do not apply
+            FileSystemEventHandler.dispatch(self, event)
+            return
         if self.ignore_directories and event.is_directory:
             return
 
@@ -565,6 +615,11 @@ class LoggingEventHandler(FileSystemEventHandler):
         what = 'directory' if event.is_directory else 'file'
         logging.info("Modified %s: %s", what, event.src_path)
 
+    def on_overflow(self, event):
+        super(LoggingEventHandler, self).on_overflow(event)
+
+        logging.warning("Events lost below: %s", event.src_path)
+
 
 class LoggingFileSystemEventHandler(LoggingEventHandler):
     """
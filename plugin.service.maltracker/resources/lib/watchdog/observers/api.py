@@ -97,6 +97,10 @@ class EventEmitter(BaseThread):
         ``float``
     """
 
+    #: Callable that takes an event, and returns ``False`` for events that
+    #: should not be queued. ``None`` queues every event.
+    event_filter = None
+
     def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT):
         BaseThread.__init__(self)
         self._event_queue = event_queue
@@ -127,6 +131,8 @@ class EventEmitter(BaseThread):
             An instance of :class:`watchdog.events.FileSystemEvent`
             or a subclass.
         """
+        if self.event_filter is not None and not self.event_filter(event):
+            return
         self._event_queue.put((event, self.watch))
 
     def queue_events(self, timeout):
@@ -255,7 +261,7 @@ class BaseObserver(EventDispatcher):
             emitter.start()
         super(BaseObserver, self).start()
 
-    def schedule(self, event_handler, path, recursive=False):
+    def schedule(self, event_handler, path, recursive=False, event_filter=None):
         """
         Schedules watching a path and calls appropriate methods specified
         in the given event handler in response to file system events.
@@ -275,6 +281,11 @@ class BaseObserver(EventDispatcher):
             traversed recursively; ``False`` otherwise.
         :type recursive:
             ``bool``
+        :param event_filter:
+            Callable that takes an event, and returns ``False`` for events
+            that should be dropped before they are queued. It is set on the
+            emitter, so it applies to every handler of the watch, and only
+            when the watch is first scheduled.
         :return:
             An :class:`ObservedWatch` object instance representing
             a watch.
@@ -288,6 +299,7 @@ class BaseObserver(EventDispatcher):
                 emitter = self._emitter_class(event_queue=self.event_queue,
                                               watch=watch,
                                               timeout=self.timeout)
+                emitter.event_filter = event_filter
                 self._add_emitter(emitter)
                 if self.is_alive():
                     emitter.start()
@@ -79,6 +79,8 @@ from watchdog.observers.api import (
     DEFAULT_EMITTER_TIMEOUT,
     DEFAULT_OBSERVER_TIMEOUT
 )
+from watchdog.observers.polling import PollingEmitter
+from watchdog.utils.dirsnapshot import DirectorySnapshot, DirectorySnapshotDiff
 
 from watchdog.events import (
     DirDeletedEvent,
@@ -89,6 +91,7 @@ from watchdog.events import (
     FileModifiedEvent,
     FileMovedEvent,
     FileCreatedEvent,
+    OverflowEvent,
     generate_sub_moved_events,
     generate_sub_created_events,
 )
@@ -111,62 +114,97 @@ class InotifyEmitter(EventEmitter):
         ``float``
     """
 
+    #: Seconds between polls of the subdirectories that could not be watched
+    #: because the inotify watch limit was reached.
+    fallback_interval = 60
+
     def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT):
         EventEmitter.__init__(self, event_queue, watch, timeout)
         self._lock = threading.Lock()
         self._inotify = None
+        self._fallback = None
+        self._fallback_count = 0
 
     def on_thread_start(self):
         path = unicode_paths.encode(self.watch.path)
         self._inotify = InotifyBuffer(path, self.watch.is_recursive)
+        self._start_fallback()
 
     def on_thread_stop(self):
+        if self._fallback:
+            self._fallback.stop()
         if self._inotify:
             self._inotify.close()
 
+    def _start_fallback(self):
+        """Hands the subdirectories that inotify could not watch over to a
+        polling emitter, which is started the first time one turns up."""
+        unwatched = self._inotify.unwatched
+        if len(unwatched) == self._fallback_count:
+            return
+        if self._fallback is None:
+            self._fallback = InotifyFallbackEmitter(self._event_queue, self.watch, self.fallback_interval)
+            self._fallback.event_filter = self.event_filter
+        for path in unwatched[self._fallback_count:]:
+            self._fallback.add_path(self._decode_path(path))
+        self._fallback_count = len(unwatched)
+        if not self._fallback.is_alive():
+            self._fallback.start()
+
     def queue_events(self, timeout):
         with self._lock:
-            event = self._inotify.read_event()
-            if event is None:
-                return
-            if isinstance(event, tuple):
-                move_from, move_to = event
-                src_path = self._decode_path(move_from.src_path)
-                dest_path = self._decode_path(move_to.src_path)
-                cls = DirMovedEvent if move_from.is_directory else FileMovedEvent
-                self.queue_event(cls(src_path, dest_path))
-                self.queue_event(DirModifiedEvent(os.path.dirname(src_path)))
-                self.queue_event(DirModifiedEvent(os.path.dirname(dest_path)))
-                if move_from.is_directory and self.watch.is_recursive:
-                    for sub_event in generate_sub_moved_events(src_path, dest_path):
-                        self.queue_event(sub_event)
+            events = self._inotify.read_events()
+            if not events:
                 return
-
-            src_path = self._decode_path(event.src_path)
-            if event.is_moved_to:
-                cls = DirCreatedEvent if event.is_directory else FileCreatedEvent
-                self.queue_event(cls(src_path))
-                self.queue_event(DirModifiedEvent(os.path.dirname(src_path)))
-                if event.is_directory and self.watch.is_recursive:
-                    for sub_event in generate_sub_created_events(src_path):
-                        self.queue_event(sub_event)
-            elif event.is_attrib:
-                cls = DirModifiedEvent if event.is_directory else FileModifiedEvent
-                self.queue_event(cls(src_path))
-            elif event.is_modify:
-                cls = DirModifiedEvent if event.is_directory else FileModifiedEvent
-                self.queue_event(cls(src_path))
-            elif event.is_delete_self:
-                cls = DirDeletedEvent if event.is_directory else FileDeletedEvent
-                self.queue_event(cls(src_path))
-            elif event.is_delete or event.is_moved_from:
-                cls = DirDeletedEvent if event.is_directory else FileDeletedEvent
-                self.queue_event(cls(src_path))
-                self.queue_event(DirModifiedEvent(os.path.dirname(src_path)))
-            elif event.is_create:
-                cls = DirCreatedEvent if event.is_directory else FileCreatedEvent
-                self.queue_event(cls(src_path))
-                self.queue_event(DirModifiedEvent(os.path.dirname(src_path)))
+            for event in events:
+                self._queue_inotify_event(event)
+
+            # A new directory may have been left out for lack of watches
+            self._start_fallback()
+
+    def _queue_inotify_event(self, event):
+        """Queues the watchdog events for an event read from the buffer, or
+        for a paired move."""
+        if isinstance(event, tuple):
+            move_from, move_to = event
+            src_path = self._decode_path(move_from.src_path)
+            dest_path = self._decode_path(move_to.src_path)
+            cls = DirMovedEvent if move_from.is_directory else FileMovedEvent
+            self.queue_event(cls(src_path, dest_path))
+            self.queue_event(DirModifiedEvent(os.path.dirname(src_path)))
+            self.queue_event(DirModifiedEvent(os.path.dirname(dest_path)))
+            if move_from.is_directory and self.watch.is_recursive:
+                for sub_event in generate_sub_moved_events(src_path, dest_path):
+                    self.queue_event(sub_event)
+            return
+
+        src_path = self._decode_path(event.src_path)
+        if event.is_q_overflow:
+            self.queue_event(OverflowEvent(src_path))
+        elif event.is_moved_to:
+            cls = DirCreatedEvent if event.is_directory else FileCreatedEvent
+            self.queue_event(cls(src_path))
+            self.queue_event(DirModifiedEvent(os.path.dirname(src_path)))
+            if event.is_directory and self.watch.is_recursive:
+                for sub_event in generate_sub_created_events(src_path):
+                    self.queue_event(sub_event)
+        elif event.is_attrib:
+            cls = DirModifiedEvent if event.is_directory else FileModifiedEvent
+            self.queue_event(cls(src_path))
+        elif event.is_modify:
+            cls = DirModifiedEvent if event.is_directory else FileModifiedEvent
+            self.queue_event(cls(src_path))
+        elif event.is_delete_self:
+            cls = DirDeletedEvent if event.is_directory else FileDeletedEvent
+            self.queue_event(cls(src_path))
+        elif event.is_delete or event.is_moved_from:
+            cls = DirDeletedEvent if event.is_directory else FileDeletedEvent
+            self.queue_event(cls(src_path))
+            self.queue_event(DirModifiedEvent(os.path.dirname(src_path)))
+        elif event.is_create:
+            cls = DirCreatedEvent if event.is_directory else FileCreatedEvent
+            self.queue_event(cls(src_path))
+            self.queue_event(DirModifiedEvent(os.path.dirname(src_path)))
 
     def _decode_path(self, path):
         """ Decode path only if unicode string was passed to this emitter. """
@@ -175,6 +213,47 @@ class InotifyEmitter(EventEmitter):
         return unicode_paths.decode(path)
 
 
+class InotifyFallbackEmitter(PollingEmitter):
+    """
+    Polls the subdirectories of an inotify watch that are left out because
+    the watch limit was reached. Events are queued under the inotify watch,
+    so they reach the same handlers.
+    """
+
+    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT):
+        PollingEmitter.__init__(self, event_queue, watch, timeout)
+        self._snapshots = dict()
+
+    def add_path(self, path):
+        """Starts polling a subdirectory, and everything below it."""
+        with self._lock:
+            if path not in self._snapshots:
+                try:
+                    self._snapshots[path] = DirectorySnapshot(path, True)
+                except OSError:
+                    pass
+
+    def on_thread_start(self):
+        pass
+
+    def queue_events(self, timeout):
+        if self.stopped_event.wait(timeout):
+            return
+
+        with self._lock:
+            for path, snapshot in list(self._snapshots.items()):
+                if not self.should_keep_running():
+                    return
+                try:
+                    new_snapshot = DirectorySnapshot(path, True)
+                except OSError:
+                    # Gone. Its deletion is reported by the parent's watch.
+                    del self._snapshots[path]
+                    continue
+                self._snapshots[path] = new_snapshot
+                self.queue_snapshot_diff(DirectorySnapshotDiff(snapshot, new_snapshot))
+
+
 class InotifyObserver(BaseObserver):
     """
     Observer thread that schedules watching directories and dispatches
@@ -35,6 +35,12 @@ class InotifyBuffer(BaseThread):
         self._inotify = Inotify(path, recursive)
         self.start()
 
+    @property
+    def unwatched(self):
+        """Subdirectories left out because the inotify watch limit was
+        reached. See :attr:`Inotify.unwatched`."""
+        return self._inotify.unwatched
+
     def read_event(self):
         """Returns a single event or a tuple of from/to events in case of a
         paired move event. If this buffer has been closed, immediately return
@@ -42,6 +48,13 @@ class InotifyBuffer(BaseThread):
         """
         return self._queue.get()
 
+    def read_events(self):
+        """Returns every event whose delay has passed, each in the same form
+        as :meth:`read_event`. If this buffer has been closed, immediately
+        return an empty list.
+        """
+        return self._queue.get_all()
+
     def on_thread_stop(self):
         self._inotify.close()
         self._queue.close()
@@ -53,24 +66,22 @@ class InotifyBuffer(BaseThread):
     def run(self):
         """Read event from `inotify` and add them to `queue`. When reading a
         IN_MOVE_TO event, remove the previous added matching IN_MOVE_FROM event
-        and add them back to the queue as a tuple.
+        and add them back to the queue as a tuple. IN_MOVE_FROM events are
+        queued under their cookie, so the match is found without a search.
         """
         while self.should_keep_running():
             inotify_events = self._inotify.read_events()
             for inotify_event in inotify_events:
                 logger.debug("in-event %s", inotify_event)
                 if inotify_event.is_moved_to:
-
-                    def matching_from_event(event):
-                        return (not isinstance(event, tuple) and event.is_moved_from
-                                and event.cookie == inotify_event.cookie)
-
-                    from_event = self._queue.remove(matching_from_event)
+                    from_event = self._queue.remove_key(inotify_event.cookie)
                     if from_event is not None:
                         self._queue.put((from_event, inotify_event))
                     else:
                         logger.debug("could not find matching move_from event")
                         self._queue.put(inotify_event)
+                elif inotify_event.is_moved_from:
+                    self._queue.put(inotify_event, inotify_event.cookie)
                 else:
                     self._queue.put(inotify_event)
 
@@ -64,6 +64,22 @@ inotify_init = ctypes.CFUNCTYPE(c_int, use_errno=True)(
     ("inotify_init", libc))
 
 
+class WatchLimitError(OSError):
+    """
+    Raised when no more inotify watches can be added, because either the
+    kernel limit (``fs.inotify.max_user_watches``) or the watch budget of
+    :class:`Inotify` was reached.
+    """
+
+
+def _max_user_watches():
+    try:
+        with open('/proc/sys/fs/inotify/max_user_watches') as f:
+            return int(f.read())
+    except (IOError, OSError, ValueError):
+        return None
+
+
 class InotifyConstants(object):
     # User-space events
     IN_ACCESS = 0x00000001     # File was accessed.
@@ -167,8 +183,20 @@ class Inotify(object):
         :class:`bytes`
     :param recursive:
         ``True`` if subdirectories should be monitored; ``False`` otherwise.
+
+    Subdirectories that cannot be watched because the watch limit was reached
+    are skipped along with everything below them, and listed in
+    :attr:`unwatched` so that they can be monitored some other way.
     """
 
+    #: Number of watches all instances may hold together, or ``None`` for no
+    #: limit other than the kernel's. Defaults to half of
+    #: ``fs.inotify.max_user_watches``, leaving the rest to other programs.
+    watch_budget = None
+
+    _watch_count = 0
+    _watch_count_lock = threading.Lock()
+
     def __init__(self, path, recursive=False, event_mask=WATCHDOG_ALL_EVENTS):
         # The file descriptor associated with the inotify instance.
         inotify_fd = inotify_init()
@@ -184,6 +212,8 @@ class Inotify(object):
         self._path = path
         self._event_mask = event_mask
         self._is_recursive = recursive
+        self._unwatched = []
+        self._closed = False
         self._add_dir_watch(path, recursive, event_mask)
         self._moved_from_events = dict()
 
@@ -207,6 +237,17 @@ class Inotify(object):
         """The file descriptor associated with the inotify instance."""
         return self._inotify_fd
 
+    @property
+    def unwatched(self):
+        """Subdirectories left out because the watch limit was reached. The
+        list only grows, in the order the directories were found."""
+        return self._unwatched
+
+    @classmethod
+    def watch_count(cls):
+        """The number of watches held by all instances together."""
+        return cls._watch_count
+
     def clear_move_records(self):
         """Clear cached records of MOVED_FROM events"""
         self._moved_from_events = dict()
@@ -260,6 +301,9 @@ class Inotify(object):
             wd = self._wd_for_path[self._path]
             inotify_rm_watch(self._inotify_fd, wd)
             os.close(self._inotify_fd)
+            if not self._closed:
+                self._closed = True
+                Inotify._release_watches(len(self._wd_for_path))
 
     def read_events(self, event_buffer_size=DEFAULT_EVENT_BUFFER_SIZE):
         """
@@ -273,15 +317,17 @@ class Inotify(object):
         def _recursive_simulate(src_path):
             events = []
             for root, dirnames, filenames in os.walk(src_path):
-                for dirname in dirnames:
+                for dirname in list(dirnames):
                     try:
                         full_path = os.path.join(root, dirname)
                         wd_dir = self._add_watch(full_path, self._event_mask)
                         e = InotifyEvent(
                             wd_dir, InotifyConstants.IN_CREATE | InotifyConstants.IN_ISDIR, 0, dirname, full_path)
                         events.append(e)
-                    except OSError:
-                        pass
+                    except OSError as e:
+                        if isinstance(e, WatchLimitError):
+                            self._unwatched.append(full_path)
+                        dirnames.remove(dirname)
                 for filename in filenames:
                     full_path = os.path.join(root, filename)
                     wd_parent_dir = self._wd_for_path[os.path.dirname(full_path)]
@@ -303,6 +349,12 @@ class Inotify(object):
             event_list = []
             for wd, mask, cookie, name in Inotify._parse_event_buffer(event_buffer):
                 if wd == -1:
+                    if mask & InotifyConstants.IN_Q_OVERFLOW:
+                        # The kernel dropped events, so directories created
+                        # meanwhile never got their watches either.
+                        if self.is_recursive:
+                            self._rewatch()
+                        event_list.append(InotifyEvent(wd, mask, cookie, name, self._path))
                     continue
                 wd_path = self._path_for_wd[wd]
                 src_path = os.path.join(wd_path, name) if name else wd_path #avoid trailing slash
@@ -339,6 +391,9 @@ class Inotify(object):
                     # instead relative to this directory.
                     try:
                         self._add_watch(src_path, self._event_mask)
+                    except WatchLimitError:
+                        self._unwatched.append(src_path)
+                        continue
                     except OSError:
                         continue
 
@@ -364,11 +419,43 @@ class Inotify(object):
         self._add_watch(path, mask)
         if recursive:
             for root, dirnames, _ in os.walk(path):
-                for dirname in dirnames:
+                for dirname in list(dirnames):
                     full_path = os.path.join(root, dirname)
                     if os.path.islink(full_path):
                         continue
-                    self._add_watch(full_path, mask)
+                    try:
+                        self._add_watch(full_path, mask)
+                    except WatchLimitError:
+                        # Out of watches. Leave the whole subtree out.
+                        self._unwatched.append(full_path)
+                        dirnames.remove(dirname)
+
+    def _rewatch(self):
+        """
+        Brings the watches in line with the directory tree after events were
+        lost: watches of directories that are gone are dropped, and new
+        directories are watched.
+        """
+        for path in list(self._wd_for_path):
+            if path != self._path and not os.path.isdir(path):
+                self._remove_watch_bookkeeping(path)
+
+        unwatched = set(self._unwatched)
+        for root, dirnames, _ in os.walk(self._path):
+            for dirname in list(dirnames):
+                full_path = os.path.join(root, dirname)
+                if full_path in unwatched:
+                    dirnames.remove(dirname)
+                    continue
+                if full_path in self._wd_for_path or os.path.islink(full_path):
+                    continue
+                try:
+                    self._add_watch(full_path, self._event_mask)
+                except WatchLimitError:
+                    self._unwatched.append(full_path)
+                    dirnames.remove(dirname)
+                except OSError:
+                    dirnames.remove(dirname)
 
     def _add_watch(self, path, mask):
         """
@@ -380,9 +467,15 @@ class Inotify(object):
         :param mask:
             Event bit mask.
         """
+        new = path not in self._wd_for_path
+        if new:
+            Inotify._reserve_watches(1)
         wd = inotify_add_watch(self._inotify_fd, path, mask)
         if wd == -1:
-            Inotify._raise_error()
+            err = ctypes.get_errno()
+            if new:
+                Inotify._release_watches(1)
+            Inotify._raise_error(err)
         self._wd_for_path[path] = wd
         self._path_for_wd[wd] = path
         return wd
@@ -390,16 +483,31 @@ class Inotify(object):
     def _remove_watch_bookkeeping(self, path):
         wd = self._wd_for_path.pop(path)
         del self._path_for_wd[wd]
+        if not self._closed:
+            Inotify._release_watches(1)
         return wd
 
+    @classmethod
+    def _reserve_watches(cls, count):
+        with cls._watch_count_lock:
+            if cls.watch_budget is not None and cls._watch_count + count > cls.watch_budget:
+                raise WatchLimitError(errno.ENOSPC, "inotify watch budget reached")
+            cls._watch_count += count
+
+    @classmethod
+    def _release_watches(cls, count):
+        with cls._watch_count_lock:
+            cls._watch_count = max(0, cls._watch_count - count)
+
     @staticmethod
-    def _raise_error():
+    def _raise_error(err=None):
         """
         Raises errors for inotify failures.
         """
-        err = ctypes.get_errno()
+        if err is None:
+            err = ctypes.get_errno()
         if err == errno.ENOSPC:
-            raise OSError("inotify watch limit reached")
+            raise WatchLimitError(err, "inotify watch limit reached")
         elif err == errno.EMFILE:
             raise OSError("inotify instance limit reached")
         else:
@@ -431,6 +539,11 @@ class Inotify(object):
             yield wd, mask, cookie, name
 
 
+_max_watches = _max_user_watches()
+if _max_watches:
+    Inotify.watch_budget = _max_watches // 2
+
+
 class InotifyEvent(object):
     """
     Inotify event struct wrapper.
@@ -478,6 +591,10 @@ class InotifyEvent(object):
     def is_modify(self):
         return self._mask & InotifyConstants.IN_MODIFY > 0
 
+    @property
+    def is_q_overflow(self):
+        return self._mask & InotifyConstants.IN_Q_OVERFLOW > 0
+
     @property
     def is_close_write(self):
         return self._mask & InotifyConstants.IN_CLOSE_WRITE > 0
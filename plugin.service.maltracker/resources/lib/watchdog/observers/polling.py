@@ -32,11 +32,19 @@ Classes
    :members:
    :show-inheritance:
    :special-members:
+
+.. autoclass:: DirectoryPollingObserver
+   :members:
+   :show-inheritance:
+   :special-members:
 """
 
 from __future__ import with_statement
+import errno
 import os
 import threading
+import time
+from stat import S_ISDIR
 from functools import partial
 from watchdog.utils import stat as default_stat
 from watchdog.utils.dirsnapshot import DirectorySnapshot, DirectorySnapshotDiff
@@ -91,26 +99,170 @@ class PollingEmitter(EventEmitter):
             new_snapshot = self._take_snapshot()
             events = DirectorySnapshotDiff(self._snapshot, new_snapshot)
             self._snapshot = new_snapshot
+            self.queue_snapshot_diff(events)
 
-            # Files.
-            for src_path in events.files_deleted:
-                self.queue_event(FileDeletedEvent(src_path))
-            for src_path in events.files_modified:
-                self.queue_event(FileModifiedEvent(src_path))
-            for src_path in events.files_created:
-                self.queue_event(FileCreatedEvent(src_path))
-            for src_path, dest_path in events.files_moved:
-                self.queue_event(FileMovedEvent(src_path, dest_path))
-
-            # Directories.
-            for src_path in events.dirs_deleted:
-                self.queue_event(DirDeletedEvent(src_path))
-            for src_path in events.dirs_modified:
-                self.queue_event(DirModifiedEvent(src_path))
-            for src_path in events.dirs_created:
-                self.queue_event(DirCreatedEvent(src_path))
-            for src_path, dest_path in events.dirs_moved:
-                self.queue_event(DirMovedEvent(src_path, dest_path))
+    def queue_snapshot_diff(self, events):
+        """Queues the events described by a :class:`DirectorySnapshotDiff`."""
+        # Files.
+        for src_path in events.files_deleted:
+            self.queue_event(FileDeletedEvent(src_path))
+        for src_path in events.files_modified:
+            self.queue_event(FileModifiedEvent(src_path))
+        for src_path in events.files_created:
+            self.queue_event(FileCreatedEvent(src_path))
+        for src_path, dest_path in events.files_moved:
+            self.queue_event(FileMovedEvent(src_path, dest_path))
+
+        # Directories.
+        for src_path in events.dirs_deleted:
+            self.queue_event(DirDeletedEvent(src_path))
+        for src_path in events.dirs_modified:
+            self.queue_event(DirModifiedEvent(src_path))
+        for src_path in events.dirs_created:
+            self.queue_event(DirCreatedEvent(src_path))
+        for src_path, dest_path in events.dirs_moved:
+            self.queue_event(DirMovedEvent(src_path, dest_path))
+
+
+class DirectoryPollingEmitter(EventEmitter):
+    """
+    Polling emitter that only stats directories. A directory is listed again
+    when its mtime changes, and only those listings are compared, so a poll
+    costs one stat per directory rather than one per file. Meant for network
+    shares, where every stat is a round trip.
+
+    Files are reported as created and deleted, and as moved along with their
+    directory. Writing to a file does not change the mtime of its directory,
+    so file modifications are not reported, and a file renamed or moved to
+    another directory comes in as deleted and created.
+    """
+
+    #: Seconds. Directories modified more recently than this are listed again
+    #: on the next poll, as they may change again within the mtime resolution
+    #: of the file system.
+    settle = 2
+
+    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT,
+                 stat=default_stat, listdir=os.listdir):
+        EventEmitter.__init__(self, event_queue, watch, timeout)
+        self._stat = stat
+        self._listdir = listdir
+        self._dirs = dict()  # path -> (mtime, inode, subdirectory names, file names)
+        self._lock = threading.Lock()
+
+    def on_thread_start(self):
+        self._dirs = self._scan(dict())
+
+    def queue_events(self, timeout):
+        # timeout behaves like an interval for polling emitters.
+        if self.stopped_event.wait(timeout):
+            return
+
+        with self._lock:
+            if not self.should_keep_running():
+                return
+            dirs = self._scan(self._dirs)
+            self.queue_listing_diff(self._dirs, dirs)
+            self._dirs = dirs
+
+    def _scan(self, old):
+        """
+        Returns the directory listings of the watched tree. Directories whose
+        mtime matches their entry in ``old`` are not listed again.
+        """
+        new = dict()
+        stack = [self.watch.path]
+        while stack:
+            path = stack.pop()
+            entry = old.get(path)
+            try:
+                st = self._stat(path)
+                if entry is None or entry[0] != st.st_mtime:
+                    entry = self._list(path, st, entry)
+            except OSError as e:
+                # Keep the last listing of a directory that cannot be reached
+                # for now, so that a network hiccup is not reported as its
+                # contents being deleted.
+                if path == self.watch.path:
+                    return old
+                if entry is None or e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+            new[path] = entry
+            if self.watch.is_recursive:
+                stack.extend(os.path.join(path, name) for name in entry[2])
+        return new
+
+    def _list(self, path, st, previous):
+        """
+        Lists a directory. Names found in the ``previous`` listing keep their
+        type, so only new names are stat'ed.
+        """
+        dirnames = set()
+        filenames = set()
+        for name in self._listdir(path):
+            if previous is not None and name in previous[2]:
+                dirnames.add(name)
+            elif previous is not None and name in previous[3]:
+                filenames.add(name)
+            else:
+                try:
+                    isdir = S_ISDIR(self._stat(os.path.join(path, name)).st_mode)
+                except OSError:
+                    continue
+                (dirnames if isdir else filenames).add(name)
+
+        mtime = st.st_mtime
+        if time.time() - mtime < self.settle:
+            mtime = None
+        return mtime, (st.st_ino, st.st_dev), frozenset(dirnames), frozenset(filenames)
+
+    def queue_listing_diff(self, old, new):
+        """
+        Queues the events between two sets of directory listings: moves
+        first, then deletions, then creations, parents before their contents.
+        """
+        # A directory that left one path and turned up at another under the
+        # same inode was moved. Some file systems do not have inode numbers.
+        removed = dict((old[path][1], path) for path in old
+                       if path not in new and old[path][1][0])
+        moves = dict()  # destination -> source
+        for path in new:
+            if path not in old and new[path][1] in removed:
+                moves[path] = removed.pop(new[path][1])
+
+        moved = []
+        deleted = []
+        created = []
+        modified = []
+        for path in sorted(removed.values()):
+            deleted.append(DirDeletedEvent(path))
+            deleted.extend(FileDeletedEvent(os.path.join(path, name))
+                           for name in sorted(old[path][3]))
+
+        for path in sorted(new):
+            entry = new[path]
+            src_path = moves.get(path, path)
+            previous = old.get(src_path)
+            if previous is entry:
+                continue
+            if previous is None:
+                created.append(DirCreatedEvent(path))
+                filenames = frozenset()
+            else:
+                filenames = previous[3]
+                if src_path != path:
+                    moved.append(DirMovedEvent(src_path, path))
+                    moved.extend(FileMovedEvent(os.path.join(src_path, name), os.path.join(path, name))
+                                 for name in sorted(entry[3] & filenames))
+                if entry[2] != previous[2] or entry[3] != filenames:
+                    modified.append(DirModifiedEvent(path))
+            deleted.extend(FileDeletedEvent(os.path.join(path, name))
+                           for name in sorted(filenames - entry[3]))
+            created.extend(FileCreatedEvent(os.path.join(path, name))
+                           for name in sorted(entry[3] - filenames))
+
+        for event in moved + deleted + created + modified:
+            self.queue_event(event)
 
 
 class PollingObserver(BaseObserver):
@@ -137,3 +289,17 @@ class PollingObserverVFS(BaseObserver):
         """
         emitter_cls = partial(PollingEmitter, stat=stat, listdir=listdir)
         BaseObserver.__init__(self, emitter_class=emitter_cls, timeout=polling_interval)
+
+
+class DirectoryPollingObserver(BaseObserver):
+    """
+    Observer that polls directories only, and lists just those that changed.
+    See :class:`DirectoryPollingEmitter` for what it reports.
+    """
+
+    def __init__(self, polling_interval=DEFAULT_OBSERVER_TIMEOUT):
+        """
+        :type polling_interval: float
+        :param polling_interval: interval in seconds between polling the file system.
+        """
+        BaseObserver.__init__(self, emitter_class=DirectoryPollingEmitter, timeout=polling_interval)
@@ -18,20 +18,32 @@ import time
 import threading
 from collections import deque
 
+# Marks queue entries whose element was taken out ahead of its turn
+_removed = object()
+
 
 class DelayedQueue(object):
+    """Queue that holds each element back for `delay` seconds after it was
+    put. Elements put under a key can be taken out early by that key, in
+    constant time.
+    """
 
     def __init__(self, delay):
         self.delay = delay
         self._lock = threading.Lock()
         self._not_empty = threading.Condition(self._lock)
-        self._queue = deque()
+        self._queue = deque()  # [element, insert time, key] entries, oldest first
+        self._keys = dict()    # key -> queue entry of the element put under it
         self._closed = False
 
-    def put(self, element):
-        """Add element to queue."""
+    def put(self, element, key=None):
+        """Add element to queue, optionally under a key for
+        :meth:`remove_key`."""
+        entry = [element, time.time(), key]
         self._lock.acquire()
-        self._queue.append((element, time.time()))
+        self._queue.append(entry)
+        if key is not None:
+            self._keys[key] = entry
         self._not_empty.notify()
         self._lock.release()
 
@@ -47,17 +59,31 @@ class DelayedQueue(object):
         """Remove and return an element from the queue, or this queue has been
         closed raise the Closed exception.
         """
+        elements = self._get(1)
+        return elements[0] if elements else None
+
+    def get_all(self):
+        """Remove and return every element whose delay has passed, waiting
+        for the oldest one if none has. Returns an empty list once the queue
+        has been closed.
+        """
+        return self._get(None)
+
+    def _get(self, limit):
         while True:
             # wait for element to be added to queue
             self._not_empty.acquire()
-            while len(self._queue) == 0 and not self._closed:
-                self._not_empty.wait()
+            try:
+                self._purge()
+                while len(self._queue) == 0 and not self._closed:
+                    self._not_empty.wait()
+                    self._purge()
 
-            if self._closed:
+                if self._closed:
+                    return []
+                insert_time = self._queue[0][1]
+            finally:
                 self._not_empty.release()
-                return None
-            head, insert_time = self._queue[0]
-            self._not_empty.release()
 
             # wait for delay
             time_left = insert_time + self.delay - time.time()
@@ -65,24 +91,59 @@ class DelayedQueue(object):
                 time.sleep(time_left)
                 time_left = insert_time + self.delay - time.time()
 
-            # return element if it's still in the queue
+            # take every element that is due, in one go
+            elements = []
             self._lock.acquire()
             try:
-                if len(self._queue) > 0 and self._queue[0][0] is head:
+                now = time.time()
+                while self._queue and (limit is None or len(elements) < limit):
+                    element, insert_time, key = self._queue[0]
+                    if element is not _removed:
+                        if insert_time + self.delay > now:
+                            break
+                        if key is not None and self._keys.get(key) is self._queue[0]:
+                            del self._keys[key]
+                        elements.append(element)
                     self._queue.popleft()
-                    return head
             finally:
                 self._lock.release()
+            if elements:
+                return elements
+
+    def _purge(self):
+        # Drops removed entries off the head of the queue. Must hold the lock.
+        while self._queue and self._queue[0][0] is _removed:
+            self._queue.popleft()
 
     def remove(self, predicate):
         """Remove and return the first items for which predicate is True,
         ignoring delay."""
         try:
             self._lock.acquire()
-            for i, (elem, t) in enumerate(self._queue):
-                if predicate(elem):
-                    del self._queue[i]
-                    return elem
+            for entry in self._queue:
+                if entry[0] is not _removed and predicate(entry[0]):
+                    return self._take(entry)
         finally:
             self._lock.release()
         return None
+
+    def remove_key(self, key):
+        """Remove and return the element put under key, ignoring delay.
+        Returns None if there is none."""
+        try:
+            self._lock.acquire()
+            entry = self._keys.get(key)
+            if entry is not None:
+                return self._take(entry)
+        finally:
+            self._lock.release()
+        return None
+
+    def _take(self, entry):
+        # Takes an element out ahead of its turn. Must hold the lock. The
+        # entry stays in the queue, and is dropped when it reaches the head.
+        element = entry[0]
+        entry[0] = _removed
+        if entry[2] is not None and self._keys.get(entry[2]) is entry:
+            del self._keys[entry[2]]
+        return element
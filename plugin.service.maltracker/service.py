@@ -10,10 +10,11 @@ import urllib2
 import xbmc, xbmcaddon, xbmcgui
 import sys, os
 import datetime
+from collections import deque
 from threading import Thread, Event, Lock
 from resources.lib.database import AnimeDatabase
 from resources.lib.relations import Relationships
-from resources.lib.util import int2
+from resources.lib.util import int2, atomic_write
 from resources.lib.service.base import AnimeService
 from resources.lib.service.mal import MALService
 from resources.lib.service.anilist import ALService
@@ -78,11 +79,28 @@ lib = os.path.join(__path__, 'resources', 'lib')
 sys.path.append(lib)
 
 # Import the folder monitoring lib.
-from watchdog.events import PatternMatchingEventHandler
+from watchdog.events import PatternMatchingEventHandler, EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED, \
+    EVENT_TYPE_MODIFIED, EVENT_TYPE_OVERFLOW
 from watchdog.observers import Observer
+from watchdog.observers.polling import DirectoryPollingObserver
+
+def getlibraries():
+    """Returns the configured library folders as (path, poll interval in seconds, or 0) pairs"""
+    libraries = []
+    for suffix in ("", "2", "3"):
+        path = __addon__.getSetting("maltLibraryPath" + suffix)
+        if path:
+            interval = 0
+            if __addon__.getSetting("maltLibraryPoll" + suffix) == "true":
+                interval = max(1, int2(__addon__.getSetting("maltLibraryInterval" + suffix), Main._poll_interval))
+            libraries.append((path, interval))
+    return libraries
 
 class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the playback and file notifications
     _svc_cache = {}
+    _poll_interval = 30  # seconds between checks of library folders that are polled, unless set otherwise
+    _event_quiet = 2     # seconds without file events before a batch of them is applied
+    _event_maxwait = 10  # seconds a batch may be held back while events keep arriving
 
     """Main Service"""
     def __init__(self):
@@ -90,9 +108,8 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
         super(Main, self).__init__()
 
         # Build list of watch extensions from the supported media list
-        media = xbmc.getSupportedMedia("video")
-        media = media.replace(".", "*.")
-        medialist = media.split("|")
+        self._extensions = xbmc.getSupportedMedia("video").split("|")
+        medialist = ["*" + ext for ext in self._extensions]
         PatternMatchingEventHandler.__init__(self, patterns=medialist, ignore_directories=True)
 
         # Property Initialization
@@ -100,8 +117,13 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
         self._lastanime = None
         self._lastepisode = 0
         self._playstart = None
-        self._observer = None
+        self._observers = {}  # (path, interval) -> running observer, or None if it could not be started
+        self._events = deque()  # watchdog events waiting to be applied, oldest first
+        self._eventfirst = 0    # time of the oldest waiting event
+        self._eventlast = 0     # time of the newest waiting event
         self._updatethread = None
+        self._reconcilethread = None  # checks library folders whose file events were lost
+        self._ignoresettings = None   # raw ignore settings last applied to the library filter
         self._shutdown = Event()
         self._iolock = Lock()
         self._allow_update = __addon__.getSetting("maltAllowUpdate") == "true"
@@ -114,11 +136,11 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
                 __addon__.openSettings()
 
         # Grab settings
-        libpath = __addon__.getSetting("maltLibraryPath")
+        libpaths = [path for path, interval in getlibraries()]
         sync = False
 
-        # Emit a notification error, if the library path is no longer valid
-        if libpath and not os.path.isdir(libpath):
+        # Emit a notification error, if a library path is no longer valid
+        if any(not os.path.isdir(path) for path in libpaths):
             notify(getstring(207), 2)  # folder is invalid
 
         # Build the relative episode relationship database
@@ -150,13 +172,21 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
             log("Initializing with service: {0}".format(self._service.id))
 
         # Create the video database
-        self._db = AnimeDatabase(__profile__, self._service, libpath)
+        self._db = AnimeDatabase(__profile__, self._service, libpaths)
+        self._db.scanprocesses = int2(__addon__.getSetting("maltScanProcesses"))
+        self._db.scanthreads = int2(__addon__.getSetting("maltScanThreads"))
+        self._db.filter.extensions = self._extensions
+        self.update_filter()
         if self._service.cansync:
             if __addon__.getSetting("maltAutoSync") == "true":
                 sync = True
             elif not self._db and xbmcgui.Dialog().yesno(__addonname__, getstring(202)):  # no entries. sync now?
                 sync = True
 
+        # The lister may browse as soon as the first jar is written, which can happen part way through the first scan.
+        # Commands sent in the meantime wait on the ipc until the main loop picks them up
+        __ipc__.setProperty("maltinit", "true")  # We are ready to go
+
         # Do a sync if needed, otherwise do the initial episode search and then write out the jar
         if sync:
             self.sync()
@@ -165,11 +195,10 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
             self.push_queue()
 
             # Search for available episodes and then write the database to the jar.
-            self._db.find_episodes()
+            self.find_episodes()
             self.updatejar()
 
         # Start the main service loop
-        __ipc__.setProperty("maltinit", "true")  # We are ready to go
         self.daemon()
 
     def getService(self):
@@ -209,14 +238,11 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
         # If the user is allowing any file to trip an update, then skip these checks
         if __addon__.getSetting("maltUpdateAny") != "true":
             # No library, so just cancel out
-            if not self._db.library:
+            if not self._db.libraries:
                 return
 
-            # Check to make sure the file being played is inside the library folder
-            try:
-                if filepath.index(self._db.library) != 0:
-                    return
-            except ValueError:
+            # Check to make sure the file being played is inside one of the library folders
+            if not any(filepath.startswith(path) for path in self._db.libraries):
                 return
 
         # Lookup the anime database entry
@@ -261,30 +287,173 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
             self.updatewatched(self._lastanime, self._lastepisode, True)
             xbmc.executebuiltin('Container.Refresh()')
 
+    def dispatch(self, event):
+        """WATCHDOG: Folder paths never match the video patterns, so let folder moves through before matching"""
+        if event.is_directory:
+            if event.event_type == EVENT_TYPE_MOVED:
+                self.on_moved(event)
+            elif event.event_type == EVENT_TYPE_CREATED:
+                self.on_created(event)
+            elif event.event_type == EVENT_TYPE_DELETED:
+                self.on_deleted(event)
+            elif event.event_type == EVENT_TYPE_OVERFLOW:
+                self.on_overflow(event)
+            return
+        PatternMatchingEventHandler.dispatch(self, event)
+
+    def accepts_event(self, event):
+        """WATCHDOG: Drops events before they are queued for dispatch"""
+        # Copying a file in sends a modified event for every write, and nothing here acts on those
+        if event.event_type == EVENT_TYPE_MODIFIED:
+            return False
+        return event.is_directory or self.matches(event)
+
     def on_created(self, event):
-        """WATCHDOG: A file was created"""
-        if self._db.add_episode(event.src_path):
-            with self._iolock:
+        """WATCHDOG: A file or folder was created"""
+        self.queue_event(event)
+
+    def on_deleted(self, event):
+        """WATCHDOG: A file or folder was deleted"""
+        self.queue_event(event)
+
+    def on_moved(self, event):
+        """WATCHDOG: A file or folder was moved or renamed"""
+        self.queue_event(event)
+
+    def on_overflow(self, event):
+        """WATCHDOG: Events were lost for a library folder, such as when a large copy outran the event queue"""
+        self.queue_event(event)
+
+    def queue_event(self, event):
+        """Holds a file event back, so that a burst of them, such as a season being copied in, is applied as one batch"""
+        now = time.time()
+        if not self._events:
+            self._eventfirst = now
+        self._eventlast = now
+        self._events.append(event)
+
+    def process_events(self):
+        """Applies the waiting file events as one batch, once they have been quiet for a moment"""
+        if not self._events:
+            return
+        if self._reconcilethread is not None and self._reconcilethread.is_alive():
+            return  # applied once the library check is done
+        now = time.time()
+        if now - self._eventlast < Main._event_quiet and now - self._eventfirst < Main._event_maxwait:
+            return
+
+        changed = False
+        moved = ()    # folders moved in this batch. Their files come in as separate moves, which are already applied
+        scanned = ()  # folders created in this batch. Their files were picked up when the folder was scanned
+        overflowed = set()  # library folders that lost events, and need to be checked again
+        with self._iolock:
+            while self._events:
+                event = self._events.popleft()
+                if event.event_type == EVENT_TYPE_OVERFLOW:
+                    overflowed.add(event.src_path)
+                elif event.event_type == EVENT_TYPE_CREATED and not event.src_path.startswith(scanned):
+                    if event.is_directory:
+                        found = self._db.scan_folder(event.src_path)
+                        if found is not None:
+                            changed = found or changed
+                            scanned += (os.path.join(event.src_path, ""),)
+                    else:
+                        changed = self._db.add_episode(event.src_path) or changed
+                elif event.event_type == EVENT_TYPE_DELETED:
+                    if event.is_directory:
+                        changed = self._db.remove_folder(event.src_path) or changed
+                    else:
+                        changed = self._db.remove_episode(event.src_path) or changed
+                elif event.event_type == EVENT_TYPE_MOVED and not event.src_path.startswith(moved):
+                    if event.is_directory:
+                        changed = self._db.move_folder(event.src_path, event.dest_path) or changed
+                        # Files moved out of an ignored folder are not known yet, so they still need their own events
+                        if self._db.accepts(event.src_path, True):
+                            moved += (os.path.join(event.src_path, ""),)
+                    else:
+                        changed = self._db.move_episode(event.src_path, event.dest_path) or changed
+
+            if changed:
                 __ipc__.setProperty("maltready", "false")
                 self._db.save()
                 self.updatejar()
+        if changed:
             xbmc.executebuiltin('Container.Refresh()')
 
-    def on_deleted(self, event):
-        """WATCHDOG: A file was deleted"""
-        if self._db.remove_episode(event.src_path):
-            with self._iolock:
+        if overflowed:
+            log("File events were lost for {0}, checking for changes".format(", ".join(overflowed)))
+            self._reconcilethread = Thread(target=self.reconcile, args=(list(overflowed),))
+            self._reconcilethread.start()
+
+    def reconcile(self, paths):
+        """Rescans the library folders whose file events were lost"""
+        # Runs on a thread of its own. File events that come in meanwhile are held back until it is done
+        with self._iolock:
+            changed = self.find_episodes(False, paths)
+            if changed:
                 __ipc__.setProperty("maltready", "false")
                 self._db.save()
                 self.updatejar()
+        if changed:
             xbmc.executebuiltin('Container.Refresh()')
 
+    def find_episodes(self, full=False, paths=None):
+        """Crawls the library, or the given library folders, for available episodes"""
+        # Partial results are written to the jar as they come in, so the lister can be used during long scans
+        found = self._db.find_episodes(full, self.updatejar, paths)
+        log("Episode scan complete. Title caches: " + self._db.cachestats())
+        return found
+
+    def update_observers(self, libraries):
+        """Starts a watcher for every (path, interval) library folder that lacks one, and stops the rest"""
+        for key in self._observers.keys():
+            if key not in libraries:
+                observer = self._observers.pop(key)
+                if observer is not None:
+                    observer.stop()
+                    observer.join()
+
+        for key in libraries:
+            if key not in self._observers:
+                path, interval = key
+                # A folder that cannot get file system events, usually for lack of inotify watches, is polled
+                # instead. One that cannot be watched at all is not retried until its settings change
+                observer = self.start_observer(path, interval)
+                if observer is None and not interval:
+                    log("Unable to receive file system events for {0}, polling it instead".format(path))
+                    observer = self.start_observer(path, Main._poll_interval)
+                if observer is None:
+                    notify(getstring(210), 2)
+                self._observers[key] = observer
+
+    def start_observer(self, path, interval=0):
+        """Starts watching a library folder, polling it every interval seconds if given. Returns None on failure"""
+        try:
+            observer = DirectoryPollingObserver(interval) if interval else Observer()
+            observer.schedule(self, path, True, self.accepts_event)
+            observer.start()
+            return observer
+        except:
+            return None
+
+    def update_filter(self):
+        """Applies the ignore settings to the library filter. Returns True if they changed"""
+        # This runs on every settings check, so the filter is left alone while the settings are unchanged
+        settings = (__addon__.getSetting("maltIgnoreFolders"), __addon__.getSetting("maltIgnorePatterns"))
+        if settings == self._ignoresettings:
+            return False
+        self._ignoresettings = settings
+        libfilter = self._db.filter
+        folders, patterns = libfilter.folders, libfilter.patterns
+        libfilter.folders = settings[0].split(";")
+        libfilter.patterns = settings[1].split(";")
+        return libfilter.folders != folders or libfilter.patterns != patterns
+
     def updatejar(self):
         """Creates a binary representation of the database object, so that the listing component can access it"""
         try:
-            fs = open(__picklejar__, "wb")
-            pickle.dump(self._db, fs, pickle.HIGHEST_PROTOCOL)
-            fs.close()
+            # Replace the jar in one step, so the lister never loads a partially written one
+            atomic_write(__picklejar__, pickle.dumps(self._db, pickle.HIGHEST_PROTOCOL))
             __ipc__.setProperty("maltready", "true")
             return True
 
@@ -347,7 +516,7 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
                     # Save changes to the local database
                     self._db.save()
                     d.update(85)
-                    self._db.find_episodes()
+                    self.find_episodes()
                     d.update(95)
                     self.updatejar()
                     d.update(100)
@@ -387,11 +556,7 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
     def process_settings(self):
         """Checks to see if there have been changes to a few key service settings, and applies them as needed"""
         monitorlib = __addon__.getSetting("maltMonitorLibrary") == "true"
-        if self._observer is not None and not monitorlib:
-            # turn off monitoring if the setting is off, but there is an active instance running
-            self._observer.stop()
-            self._observer.join()
-            self._observer = None
+        libraries = getlibraries()
 
         # Check if the selected service handler has changed
         svc = self.getService()
@@ -422,30 +587,26 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
                         break
                 __addon__.setSetting("maltService", idx)
 
-        # Check if the library path has been changed since launch
-        libpath = __addon__.getSetting("maltLibraryPath")
-        if libpath != self._db.library:
-            self._db.library = libpath
+        self._db.scanprocesses = int2(__addon__.getSetting("maltScanProcesses"))
+        self._db.scanthreads = int2(__addon__.getSetting("maltScanThreads"))
+        filterchanged = self.update_filter()
+
+        # Check if the library paths have been changed since launch
+        libpaths = [path for path, interval in libraries]
+        if libpaths == self._db.libraries:
+            # Rescan when the ignore settings change, so that newly ignored files drop out and the rest come back
+            if filterchanged and libpaths:
+                with self._iolock:
+                    if self.find_episodes():
+                        self.updatejar()
+        else:
+            self._db.libraries = libpaths
             with self._iolock:
-                if self._db.find_episodes():
+                if self.find_episodes():
                     self.updatejar()
 
-            # If an observer is already running, then stop it and join the thread
-            if self._observer is not None:
-                self._observer.stop()
-                self._observer.join()
-                self._observer = None
-
-        # Turn monitoring on if either the monitor setting is enabled, or the library path has changed
-        if self._observer is None and monitorlib and libpath:
-            # The previous instance is dead now (it cant be restarted), so make a new one
-            try:
-                self._observer = Observer()
-                self._observer.schedule(self, libpath, True)
-                self._observer.start()
-            except:
-                notify(getstring(210), 2)
-                self._observer = None
+        # Watch the library folders if monitoring is enabled, otherwise stop any watchers that are still running
+        self.update_observers(libraries if monitorlib else [])
 
         # Check if the user has been changed since launch
         if self._service.authchanged and self._service.cansync:
@@ -500,7 +661,7 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
                 d.create(__addonname__, getstring(216))  # scanning...
                 __ipc__.setProperty("maltready", "false")
                 with self._iolock:
-                    if self._db.find_episodes():
+                    if self.find_episodes(True):
                         self.updatejar()
                 d.close()
 
@@ -512,7 +673,7 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
                     __addon__.setSetting("maltRelLastUpdate", datetime.datetime.now().strftime("%Y-%m-%d"))
                     __ipc__.setProperty("maltready", "false")
                     with self._iolock:
-                        if self._db.find_episodes():
+                        if self.find_episodes():
                             self.updatejar()
                     d.close()
                 else:
@@ -576,8 +737,10 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
                         newvalue = xbmcgui.Dialog().input("Enter title synonyms, separate with semi-colon:", previous)
 
                         if newvalue != "" and newvalue != previous:
-                            anime.usersynonyms = newvalue
-                            self._db.find_episodes()
+                            # The library check may be scanning on its thread, so wait for it to finish first
+                            with self._iolock:
+                                anime.usersynonyms = newvalue
+                                self.find_episodes()
                             self.save()
                             xbmc.executebuiltin('Container.Refresh()')
 
@@ -768,14 +931,8 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
         monitor = self._monitor
 
         # Start watching for file changes, if enabled
-        if self._db.library and __addon__.getSetting("maltMonitorLibrary") == "true":
-            try:
-                self._observer = Observer()
-                self._observer.schedule(self, self._db.library, True)
-                self._observer.start()
-            except:
-                notify(getstring(210), 2)
-                self._observer = None
+        if __addon__.getSetting("maltMonitorLibrary") == "true":
+            self.update_observers(getlibraries())
 
         # Start the synopsis update thread, if enabled
         if __addon__.getSetting("maltUpdateEnabled") == "true":
@@ -789,16 +946,17 @@ class Main(xbmc.Player, PatternMatchingEventHandler):  # Subclasses for the play
                 break
             self.process_settings()
             self.process_commands()
+            self.process_events()
 
         # Shutdown and wait for the update worker thread
         if self._updatethread is not None:
             self._shutdown.set()
             self._updatethread.join(3)
+        if self._reconcilethread is not None:
+            self._reconcilethread.join(3)
 
         # Stop watching for file changes
-        if self._observer is not None:
-            self._observer.stop()
-            self._observer.join()
+        self.update_observers([])
 
         # Remove the jar as it is no longer needed
         if os.path.isfile(__picklejar__):  # Will be missing if uninstalling